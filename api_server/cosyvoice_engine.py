@@ -1,14 +1,54 @@
+import functools
 import json
 import os
+import pickle
 import sys
+import threading
 from contextlib import nullcontext
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable
 
+import numpy as np
 import torch
 
+try:
+    import orjson
+except ImportError:  # optional; stdlib json is used instead
+    orjson = None
 
-def _fade_out(audio: torch.Tensor, sample_rate: int = 24000, fade_ms: int = 10) -> torch.Tensor:
+try:
+    from numba import njit
+except ImportError:  # optional; the NumPy conversion is used instead
+    njit = None
+
+__all__ = ["CosyVoiceEngine"]
+
+
+if njit is not None:
+
+    @njit(cache=True, fastmath=True, nogil=True)
+    def _pcm16_kernel(audio, out):
+        # Single pass: scale, clip (no int16 wrap-around clicks), round, cast.
+        for i in range(audio.size):
+            v = audio[i] * 32767.0
+            if v > 32767.0:
+                v = 32767.0
+            elif v < -32768.0:
+                v = -32768.0
+            out[i] = np.int16(np.rint(v))
+
+else:
+    _pcm16_kernel = None
+
+
+@functools.lru_cache(maxsize=8)
+def _fade_ramp(device: torch.device, dtype: torch.dtype, fade_samples: int) -> torch.Tensor:
+    return torch.linspace(1.0, 0.0, steps=fade_samples, device=device, dtype=dtype)
+
+
+def _fade_out(
+    audio: torch.Tensor, sample_rate: int = 24000, fade_ms: int = 10, inplace: bool = False
+) -> torch.Tensor:
     if fade_ms <= 0:
         return audio
     if audio.numel() == 0:
@@ -20,26 +60,65 @@ def _fade_out(audio: torch.Tensor, sample_rate: int = 24000, fade_ms: int = 10)
     fade_samples = min(fade_samples, total)
     if fade_samples <= 1:
         return audio
-    ramp = torch.linspace(1.0, 0.0, steps=fade_samples, device=audio.device, dtype=audio.dtype)
-    audio = audio.clone()
-    audio[..., -fade_samples:] = audio[..., -fade_samples:] * ramp
+    ramp = _fade_ramp(audio.device, audio.dtype, fade_samples)
+    if not inplace:
+        audio = audio.clone()
+    audio[..., -fade_samples:].mul_(ramp)
     return audio
 
 
-def _float_audio_to_int16_bytes(audio_np):
-    # Clip to prevent int16 wrap-around which can cause sharp clicks.
-    import numpy as np
+def _collect_speech(chunks: Iterable[dict[str, Any]]) -> torch.Tensor:
+    """Concatenate tts_speech chunks into one buffer grown geometrically (no list + torch.cat)."""
+    buf: torch.Tensor | None = None
+    total = 0
+    for chunk in chunks:
+        speech = chunk.get("tts_speech")
+        if speech is None:
+            continue
+        n = speech.shape[-1]
+        if buf is None:
+            buf = torch.empty((*speech.shape[:-1], n), device=speech.device, dtype=speech.dtype)
+        elif total + n > buf.shape[-1]:
+            grown = torch.empty(
+                (*buf.shape[:-1], max(total + n, 2 * buf.shape[-1])), device=buf.device, dtype=buf.dtype
+            )
+            grown[..., :total].copy_(buf[..., :total])
+            buf = grown
+        buf[..., total : total + n].copy_(speech)
+        total += n
+
+    if buf is None:
+        raise RuntimeError("TTS produced no audio")
+    return buf[..., :total]
+
 
-    audio_np = np.asarray(audio_np, dtype=np.float32)
-    audio_np = np.clip(audio_np, -1.0, 1.0)
-    audio_i32 = np.rint(audio_np * 32767.0).astype(np.int32)
-    audio_i32 = np.clip(audio_i32, -32768, 32767)
-    return audio_i32.astype(np.int16).tobytes()
+@functools.lru_cache(maxsize=16)
+def _load_json_cached(path: str, mtime_ns: int) -> dict[str, Any]:
+    data = Path(path).read_bytes()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 def _load_json(path: Path) -> dict[str, Any]:
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    # Keyed by mtime so an edited config is re-read
+    return _load_json_cached(str(path), path.stat().st_mtime_ns)
+
+
+def _load_checkpoint(path: str | Path) -> Any:
+    """Load a checkpoint with file-backed (mmap) storages where the format allows it."""
+    path = Path(path)
+    if path.suffix == ".safetensors":
+        from safetensors.torch import load_file
+
+        return load_file(str(path), device="cpu")
+    try:
+        return torch.load(str(path), map_location="cpu", mmap=True, weights_only=True)
+    except (RuntimeError, pickle.UnpicklingError) as exc:
+        # Legacy (non-zipfile) checkpoints can't be mmapped, and ones pickling non-tensor
+        # objects are refused by the safe loader. IO errors etc. propagate.
+        print(f"[TTS] falling back to full unpickling (weights_only=False) for {path}: {exc}", flush=True)
+        return torch.load(str(path), map_location="cpu", weights_only=False)
 
 
 def _extract_state_dict(checkpoint: Any) -> dict[str, torch.Tensor]:
@@ -64,6 +143,28 @@ def _extract_state_dict(checkpoint: Any) -> dict[str, torch.Tensor]:
     raise TypeError(f"Unsupported checkpoint type: {type(checkpoint).__name__}")
 
 
+def _module_tensors(module: Any) -> dict[str, torch.Tensor]:
+    tensors = dict(module.named_parameters())
+    tensors.update(module.named_buffers())
+    return tensors
+
+
+def _match_module_state(module: Any, state: dict[str, torch.Tensor]) -> dict[str, torch.Tensor]:
+    """Move a CPU state_dict onto the module's devices/dtypes, dropping keys it doesn't have."""
+    targets = _module_tensors(module)
+    matched: dict[str, torch.Tensor] = {}
+    for name, tensor in state.items():
+        target = targets.get(name)
+        if target is None:
+            continue
+        if target.shape != tensor.shape:
+            raise RuntimeError(
+                f"size mismatch for {name}: checkpoint {tuple(tensor.shape)} vs model {tuple(target.shape)}"
+            )
+        matched[name] = tensor.to(device=target.device, dtype=target.dtype, non_blocking=True)
+    return matched
+
+
 def _resolve_speaker_id(spk2embedding: Any, preferred_id: str) -> str:
     if isinstance(spk2embedding, dict) and preferred_id in spk2embedding:
         return preferred_id
@@ -82,6 +183,9 @@ def _to_embedding_tensor(value: Any) -> torch.Tensor:
 
     if tensor.dim() == 1:
         tensor = tensor.unsqueeze(0)
+    if torch.cuda.is_available():
+        # Pinned so the upload to the model device can be asynchronous
+        tensor = tensor.pin_memory()
     return tensor
 
 
@@ -91,13 +195,64 @@ def _truthy(value: str | None) -> bool:
     return value.strip().lower() in {"1", "true", "yes", "on"}
 
 
-def _autocast_context():
+def _autocast_dtype() -> torch.dtype | None:
     if not torch.cuda.is_available():
+        return None
+    # TTS_AUTOCAST_DTYPE=bf16|fp16|off (default: auto). TTS_FP16=0 still disables it.
+    choice = os.getenv("TTS_AUTOCAST_DTYPE", "auto").strip().lower()
+    if choice == "off" or not _truthy(os.getenv("TTS_FP16", "1")):
+        return None
+    if choice == "fp16":
+        return torch.float16
+    if choice == "bf16":
+        return torch.bfloat16
+    # Ampere+ runs bf16 at fp16 speed without fp16's range clamps
+    return torch.bfloat16 if torch.cuda.get_device_capability()[0] >= 8 else torch.float16
+
+
+def _autocast_context():
+    dtype = _autocast_dtype()
+    if dtype is None:
         return nullcontext()
-    # Default: on. Can disable with TTS_FP16=0
-    if _truthy(os.getenv("TTS_FP16", "1")):
-        return torch.autocast(device_type="cuda", dtype=torch.float16)
-    return nullcontext()
+    return torch.autocast(device_type="cuda", dtype=dtype)
+
+
+def _quantize_llm(module: Any, scheme: str) -> None:
+    """Weight-only quantize the LLM's Linear layers in place (torchao).
+
+    Decode reads every weight per token, so int8/int4 weights cut the dominant
+    memory traffic. int4 kernels require bfloat16 weights.
+    """
+    from torchao.quantization import quantize_
+
+    try:
+        from torchao.quantization import Int4WeightOnlyConfig, Int8WeightOnlyConfig
+
+        config = Int4WeightOnlyConfig() if scheme == "int4" else Int8WeightOnlyConfig()
+    except ImportError:
+        from torchao.quantization import int4_weight_only, int8_weight_only
+
+        config = int4_weight_only() if scheme == "int4" else int8_weight_only()
+
+    if scheme == "int4":
+        module.to(torch.bfloat16)
+    quantize_(module, config)
+
+
+def _compile_inner_modules(inner: Any) -> None:
+    """torch.compile the submodules called from llm/flow/hift inference.
+
+    CosyVoice drives these through custom ``inference`` methods rather than
+    ``forward``, so we compile their children in place (``nn.Module.compile``)
+    which keeps parameter names intact for LoRA state_dict application.
+    """
+    mode = os.getenv("TTS_COMPILE_MODE", "reduce-overhead")
+    for name in ("llm", "flow", "hift"):
+        module = getattr(inner, name, None)
+        if module is None:
+            continue
+        for child in module.children():
+            child.compile(mode=mode, fullgraph=False, dynamic=True)
 
 
 class CosyVoiceEngine:
@@ -132,6 +287,14 @@ class CosyVoiceEngine:
             or str(Path(__file__).resolve().parent / "speaker_config.json")
         )
 
+        if torch.cuda.is_available():
+            # TF32 for the fp32 matmuls/convs that run outside autocast
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+
+        # Persist inductor artifacts so the compile warmup is paid once per machine, not per process.
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(Path.home() / ".cache" / "cosyvoice_inductor"))
+
         try:
             from cosyvoice.cli.cosyvoice import CosyVoice2 as _CosyVoice
         except Exception:
@@ -139,13 +302,35 @@ class CosyVoiceEngine:
 
         self.model = _CosyVoice(str(self.model_dir))
 
+        # Opt-in: TTS_QUANT=int8|int4 (LLM only; flow/HiFiGAN stay in float)
+        quant = os.getenv("TTS_QUANT", "").strip().lower()
+        self._llm_quant = quant if quant in {"int8", "int4"} and torch.cuda.is_available() else None
+        if self._llm_quant:
+            _quantize_llm(self.model.model.llm, self._llm_quant)
+
+        # Opt-in: TTS_COMPILE=1 (first calls are slow while kernels/graphs are captured)
+        self.compiled = False
+        if _truthy(os.getenv("TTS_COMPILE")) and torch.cuda.is_available():
+            _compile_inner_modules(getattr(self.model, "model", None))
+            self.compiled = True
+
         self._speaker_config: dict[str, Any] = {"speakers": {}, "default_speaker": None}
         if self.speaker_config_path.exists():
             self._speaker_config = _load_json(self.speaker_config_path)
 
-        self._lora_cache_llm: dict[str, dict[str, torch.Tensor]] = {}
-        self._lora_cache_flow: dict[str, dict[str, torch.Tensor]] = {}
         self._embedding_cache: dict[str, torch.Tensor] = {}
+        # LoRA weights already on the modules' devices, ready for in-place copy_
+        self._lora_gpu_llm: dict[str, dict[str, torch.Tensor]] = {}
+        self._lora_gpu_flow: dict[str, dict[str, torch.Tensor]] = {}
+        self._active_speaker: str | None = None
+        # Per-thread scratch buffers for PCM conversion (grown on demand, never shrunk)
+        self._pcm_scratch = threading.local()
+        if _pcm16_kernel is not None and not _truthy(os.getenv("TTS_PCM_ON_DEVICE", "1")):
+            # Only the CPU conversion path uses the kernel; pay its JIT (or cache load) now, not per request
+            _pcm16_kernel(np.zeros(1, dtype=np.float32), np.empty(1, dtype=np.int16))
+
+        # Read and upload every speaker now so a switch is only copy_ on the request path
+        self.preload_failures = self.preload_speakers()
 
     def get_default_speaker(self) -> str | None:
         default = self._speaker_config.get("default_speaker")
@@ -156,12 +341,36 @@ class CosyVoiceEngine:
             return next(iter(speakers.keys()))
         return None
 
-    def _apply_state_dict(self, module: Any, state: dict[str, torch.Tensor]) -> None:
-        if module is None:
-            raise RuntimeError("Target module not found (cannot apply LoRA checkpoint)")
-        module.load_state_dict(state, strict=False)
+    def _apply_state_dict(self, module: Any, state: dict[str, torch.Tensor], quant: str | None = None) -> None:
+        if quant:
+            # Quantized weights can't be copy_'d into: swap in the speaker's pre-quantized tensors.
+            module.load_state_dict(state, strict=False, assign=True)
+            return
+
+        # Copy into the existing storages: no reallocation, compiled graphs stay valid
+        targets = _module_tensors(module)
+        with torch.no_grad():
+            for name, tensor in state.items():
+                targets[name].copy_(tensor, non_blocking=True)
+
+    def _llm_module(self) -> Any:
+        return getattr(getattr(self.model, "model", None), "llm", None)
+
+    def _flow_module(self) -> Any:
+        inner = getattr(self.model, "model", None)
+        flow_module = getattr(inner, "flow", None)
+        if flow_module is None:
+            flow_module = getattr(inner, "flow_model", None)
+        return flow_module
+
+    def _model_device(self) -> torch.device:
+        try:
+            return next(self._llm_module().parameters()).device
+        except (AttributeError, StopIteration):
+            return torch.device("cpu")
 
-    def load_speaker_lora(self, speaker_id: str) -> bool:
+    def _prepare_speaker(self, speaker_id: str) -> dict[str, Any]:
+        """Load a speaker's checkpoints onto the modules' devices (no module weights are touched)."""
         speakers = self._speaker_config.get("speakers")
         if not isinstance(speakers, dict) or speaker_id not in speakers:
             raise KeyError(f"Speaker '{speaker_id}' not found in {self.speaker_config_path}")
@@ -174,48 +383,120 @@ class CosyVoiceEngine:
         flow_path = info.get("flow_lora_model_path")
         embedding_path = info.get("spk_embedding_path")
 
-        # 1) Load/apply LLM LoRA (whole-pt)
-        if llm_path:
-            if speaker_id not in self._lora_cache_llm:
-                ckpt = torch.load(str(llm_path), map_location="cpu")
-                self._lora_cache_llm[speaker_id] = _extract_state_dict(ckpt)
-
-            llm_module = getattr(getattr(self.model, "model", None), "llm", None)
-            self._apply_state_dict(llm_module, self._lora_cache_llm[speaker_id])
+        if llm_path and speaker_id not in self._lora_gpu_llm:
+            llm_state = self._upload_state(self._llm_module(), llm_path)
+            if self._llm_quant:
+                llm_state = self._quantize_llm_state(llm_state)
+            self._lora_gpu_llm[speaker_id] = llm_state
 
-        # 2) Load/apply Flow LoRA (optional)
-        if flow_path:
-            if speaker_id not in self._lora_cache_flow:
-                ckpt = torch.load(str(flow_path), map_location="cpu")
-                self._lora_cache_flow[speaker_id] = _extract_state_dict(ckpt)
+        if flow_path and speaker_id not in self._lora_gpu_flow:
+            self._lora_gpu_flow[speaker_id] = self._upload_state(self._flow_module(), flow_path)
 
-            flow_module = getattr(getattr(self.model, "model", None), "flow", None)
-            if flow_module is None:
-                flow_module = getattr(getattr(self.model, "model", None), "flow_model", None)
-            self._apply_state_dict(flow_module, self._lora_cache_flow[speaker_id])
-
-        # 3) Load/register speaker embedding
         if embedding_path and speaker_id not in self._embedding_cache:
-            spk2embedding = torch.load(str(embedding_path), map_location="cpu")
+            spk2embedding = _load_checkpoint(embedding_path)
             resolved_id = _resolve_speaker_id(spk2embedding, speaker_id)
             embedding = _to_embedding_tensor(spk2embedding[resolved_id])
-            self._embedding_cache[speaker_id] = embedding
+            # Keep it on the model device so inference doesn't pay an H2D copy per call
+            self._embedding_cache[speaker_id] = embedding.to(self._model_device(), non_blocking=True)
+
+        return info
+
+    def _quantize_llm_state(self, state: dict[str, torch.Tensor]) -> dict[str, torch.Tensor]:
+        """Quantize a speaker's float LLM weights once and return the resulting tensors.
+
+        Only the quantized tensors are kept, so a switch is a reference swap and the
+        float copy is freed instead of sitting in VRAM next to every other speaker.
+        """
+        module = self._llm_module()
+        # The module ends up holding this speaker's weights without its embedding registered
+        self._active_speaker = None
+        module.load_state_dict(state, strict=False, assign=True)
+        _quantize_llm(module, self._llm_quant)
+        tensors = _module_tensors(module)
+        return {name: tensors[name] for name in state}
+
+    @staticmethod
+    def _upload_state(module: Any, path: str) -> dict[str, torch.Tensor]:
+        if module is None:
+            raise RuntimeError("Target module not found (cannot apply LoRA checkpoint)")
+        return _match_module_state(module, _extract_state_dict(_load_checkpoint(path)))
+
+    def preload_speakers(self) -> dict[str, Exception]:
+        """Load every configured speaker's checkpoints. Returns failures by speaker id."""
+        failures: dict[str, Exception] = {}
+        speakers = self._speaker_config.get("speakers")
+        for speaker_id in speakers if isinstance(speakers, dict) else {}:
+            try:
+                self._prepare_speaker(speaker_id)
+            except Exception as exc:
+                failures[speaker_id] = exc
+        return failures
 
+    def load_speaker_lora(self, speaker_id: str) -> bool:
+        if speaker_id == self._active_speaker:
+            return True
+
+        self._prepare_speaker(speaker_id)
+        self._active_speaker = None
+
+        # 1) Apply LLM LoRA (whole-pt)
+        if speaker_id in self._lora_gpu_llm:
+            self._apply_state_dict(self._llm_module(), self._lora_gpu_llm[speaker_id], quant=self._llm_quant)
+
+        # 2) Apply Flow LoRA (optional)
+        if speaker_id in self._lora_gpu_flow:
+            self._apply_state_dict(self._flow_module(), self._lora_gpu_flow[speaker_id])
+
+        # 3) Register speaker embedding
         if speaker_id in self._embedding_cache:
             # CosyVoice2 uses frontend.spk2info for speaker registry
             self.model.frontend.spk2info[speaker_id] = {"embedding": self._embedding_cache[speaker_id]}
 
+        self._active_speaker = speaker_id
         return True
 
+    def _pcm_scratch_buffer(self, name: str, n: int, dtype: Any) -> np.ndarray:
+        buf = getattr(self._pcm_scratch, name, None)
+        if buf is None or buf.size < n:
+            buf = np.empty(n, dtype=dtype)
+            setattr(self._pcm_scratch, name, buf)
+        return buf[:n]
+
+    def _to_pcm16(self, audio_np: np.ndarray) -> bytes:
+        audio_np = audio_np.reshape(-1)
+        n = audio_np.size
+        i16 = self._pcm_scratch_buffer("i16", n, np.int16)
+        if _pcm16_kernel is not None:
+            _pcm16_kernel(audio_np, i16)
+            return i16.tobytes()
+
+        f32 = self._pcm_scratch_buffer("f32", n, np.float32)
+        np.multiply(audio_np, 32767.0, out=f32)
+        # Clip to prevent int16 wrap-around which can cause sharp clicks.
+        np.clip(f32, -32768.0, 32767.0, out=f32)
+        np.rint(f32, out=f32)
+        np.copyto(i16, f32, casting="unsafe")
+        return i16.tobytes()
+
+    def _speech_to_pcm16(self, speech: torch.Tensor) -> bytes | memoryview:
+        speech = speech.squeeze(0).detach()
+        # Debug: TTS_PCM_ON_DEVICE=0 transfers float audio and converts with NumPy
+        if not _truthy(os.getenv("TTS_PCM_ON_DEVICE", "1")):
+            return self._to_pcm16(speech.float().contiguous().cpu().numpy())
+
+        # Convert on device so only int16 crosses PCIe. Out-of-place first op:
+        # streamed chunks may alias CosyVoice's cross-fade cache.
+        pcm = (speech.float() * 32767.0).clamp_(-32768.0, 32767.0).round_().to(torch.int16)
+        # pcm is a fresh buffer nobody else writes to: send a view of it rather than copying into bytes
+        return memoryview(pcm.cpu().numpy()).cast("B")
+
     def synthesize_sft_audio(self, text: str, speaker: str, speed: float = 1.0) -> torch.Tensor:
         self.load_speaker_lora(speaker)
         with torch.inference_mode(), _autocast_context():
-            result = list(self.model.inference_sft(text, speaker, stream=False, speed=speed))
-            audio = torch.cat(
-                [chunk["tts_speech"] for chunk in result if "tts_speech" in chunk], dim=1
-            )
+            audio = _collect_speech(self.model.inference_sft(text, speaker, stream=False, speed=speed))
             fade_ms = int(os.getenv("TTS_FADE_OUT_MS", "10"))
-            audio = _fade_out(audio, sample_rate=24000, fade_ms=fade_ms)
+            # audio is our own buffer, safe to fade in place
+            audio = _fade_out(audio, sample_rate=24000, fade_ms=fade_ms, inplace=True)
             return audio
 
     def stream_sft_pcm(self, text: str, speaker: str, speed: float = 1.0):
@@ -224,10 +505,25 @@ class CosyVoiceEngine:
             for chunk in self.model.inference_sft(text, speaker, stream=True, speed=speed):
                 if "tts_speech" not in chunk:
                     continue
-                audio_np = chunk["tts_speech"].squeeze(0).detach().cpu().numpy()
-                yield _float_audio_to_int16_bytes(audio_np)
+                yield self._speech_to_pcm16(chunk["tts_speech"])
 
-    def synthesize_sft_pcm(self, text: str, speaker: str, speed: float = 1.0) -> bytes:
+    def synthesize_sft_pcm(self, text: str, speaker: str, speed: float = 1.0) -> bytes | memoryview:
         audio = self.synthesize_sft_audio(text, speaker, speed=speed)
-        audio_np = audio.squeeze(0).detach().cpu().numpy()
-        return _float_audio_to_int16_bytes(audio_np)
+        return self._speech_to_pcm16(audio)
+
+    def synthesize_batch(
+        self, texts: list[str], speakers: list[str], speeds: list[float]
+    ) -> list[bytes | memoryview | Exception]:
+        """Synthesize several requests back to back in one call.
+
+        inference_sft takes a single utterance, so items run sequentially; callers
+        group by speaker so LoRA weights switch at most once per batch. Failures are
+        returned in place so one bad request doesn't fail its neighbours.
+        """
+        results: list[bytes | memoryview | Exception] = []
+        for text, speaker, speed in zip(texts, speakers, speeds):
+            try:
+                results.append(self.synthesize_sft_pcm(text, speaker, speed=speed))
+            except Exception as exc:
+                results.append(exc)
+        return results
@@ -1,16 +1,30 @@
 import asyncio
+import contextlib
 import json
 import os
+import queue
+import threading
 import time
 
 import websockets
 
 from cosyvoice_engine import CosyVoiceEngine
 
+try:
+    import orjson
+except ImportError:  # optional; stdlib json is used instead
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:  # optional; default asyncio loop is used instead
+    uvloop = None
+
 
 tts_engine: CosyVoiceEngine | None = None
 _engine_lock: asyncio.Lock | None = None
 _infer_semaphore: asyncio.Semaphore | None = None
+_batch_queue: asyncio.Queue | None = None
 
 
 def _ts() -> str:
@@ -29,10 +43,25 @@ async def _get_engine() -> CosyVoiceEngine:
             return tts_engine
         print(f"[{_ts()}] [TTS] Initializing CosyVoiceEngine...", flush=True)
         tts_engine = await asyncio.to_thread(CosyVoiceEngine)
+        for speaker_id, exc in tts_engine.preload_failures.items():
+            print(f"[{_ts()}] [TTS] preload failed for {speaker_id}: {exc}", flush=True)
         print(f"[{_ts()}] [TTS] CosyVoiceEngine ready", flush=True)
         return tts_engine
 
 
+def _json_dumps(obj) -> str:
+    # Always str: clients tell control messages (text frames) from PCM (binary frames) by type.
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+def _json_loads(data: str | bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 def _truthy(value: str | None) -> bool:
     if value is None:
         return False
@@ -47,27 +76,171 @@ def _get_infer_semaphore() -> asyncio.Semaphore:
     return _infer_semaphore
 
 
-def _stream_send_pcm_from_thread(
-    loop: asyncio.AbstractEventLoop,
-    ws,
+def _get_batch_queue() -> asyncio.Queue:
+    global _batch_queue
+    if _batch_queue is None:
+        _batch_queue = asyncio.Queue()
+    return _batch_queue
+
+
+async def _synthesize_batched(text: str, speaker: str, speed: float) -> bytes:
+    fut = asyncio.get_running_loop().create_future()
+    await _get_batch_queue().put((text, speaker, speed, fut))
+    return await fut
+
+
+async def _run_batch(batch: list, sem: asyncio.Semaphore) -> None:
+    """Synthesize one collected batch; the caller has already acquired ``sem`` for it."""
+    try:
+        engine = await _get_engine()
+        results = await asyncio.to_thread(
+            engine.synthesize_batch,
+            [item[0] for item in batch],
+            [item[1] for item in batch],
+            [item[2] for item in batch],
+        )
+    except Exception as exc:
+        results = [exc] * len(batch)
+    finally:
+        sem.release()
+
+    for (_, _, _, fut), result in zip(batch, results):
+        if fut.done():
+            continue
+        if isinstance(result, Exception):
+            fut.set_exception(result)
+        else:
+            fut.set_result(result)
+
+
+async def _batch_worker() -> None:
+    """Group non-streaming requests that are already queued; TTS_BATCH_WINDOW_MS > 0 also waits for more.
+
+    Each batch runs as its own task under the inference semaphore, so up to
+    TTS_MAX_CONCURRENCY batches are in flight. Collection starts only once a
+    slot is free, so requests that queue up behind busy slots share a batch.
+    """
+    queue = _get_batch_queue()
+    sem = _get_infer_semaphore()
+    # synthesize_batch still runs items sequentially, so waiting only adds latency by default.
+    window = float(os.getenv("TTS_BATCH_WINDOW_MS", "0")) / 1000.0
+    batch_max = max(1, int(os.getenv("TTS_BATCH_MAX", "8")))
+    loop = asyncio.get_running_loop()
+    held = None  # first request for a different speaker, starts the next batch
+    running: set[asyncio.Task] = set()
+
+    try:
+        while True:
+            first = held or await queue.get()
+            held = None
+            await sem.acquire()
+            batch = [first]
+            deadline = loop.time() + window
+            while len(batch) < batch_max:
+                remaining = deadline - loop.time()
+                try:
+                    if remaining <= 0:
+                        item = queue.get_nowait()
+                    else:
+                        item = await asyncio.wait_for(queue.get(), timeout=remaining)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item[1] != first[1]:
+                    held = item
+                    break
+                batch.append(item)
+
+            batch = [item for item in batch if not item[3].done()]
+            if not batch:
+                sem.release()
+                continue
+
+            task = asyncio.create_task(_run_batch(batch, sem))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    finally:
+        for task in running:
+            task.cancel()
+
+
+def _put_unless_cancelled(chunks: queue.Queue, item, cancelled: threading.Event) -> bool:
+    while not cancelled.is_set():
+        try:
+            chunks.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get_unless_cancelled(chunks: queue.Queue, cancelled: threading.Event):
+    """Poll so an abandoned executor thread exits once the stream is cancelled; None means stop."""
+    while not cancelled.is_set():
+        try:
+            return chunks.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+def _produce_pcm(
     engine: CosyVoiceEngine,
     text: str,
     speaker: str,
     speed: float,
+    chunks: queue.Queue,
+    cancelled: threading.Event,
 ) -> None:
-    for pcm_chunk in engine.stream_sft_pcm(text, speaker, speed=speed):
-        fut = asyncio.run_coroutine_threadsafe(ws.send(pcm_chunk), loop)
-        fut.result()
+    """Run the TTS generator on a worker thread; None marks the end of the stream."""
+    try:
+        for pcm_chunk in engine.stream_sft_pcm(text, speaker, speed=speed):
+            if not _put_unless_cancelled(chunks, pcm_chunk, cancelled):
+                return
+    finally:
+        _put_unless_cancelled(chunks, None, cancelled)
+
+
+async def _stream_send_pcm(ws, engine: CosyVoiceEngine, text: str, speaker: str, speed: float) -> None:
+    # Bounded so a slow client applies backpressure instead of buffering the whole utterance.
+    loop = asyncio.get_running_loop()
+    chunks: queue.Queue = queue.Queue(maxsize=max(1, int(os.getenv("TTS_STREAM_QUEUE_SIZE", "4"))))
+    cancelled = threading.Event()
+    frame_bytes = int(os.getenv("TTS_WS_CHUNK_BYTES", "16384"))
+    producer = loop.run_in_executor(None, _produce_pcm, engine, text, speaker, speed, chunks, cancelled)
+    try:
+        finished = False
+        while not finished:
+            pcm_chunk = await loop.run_in_executor(None, _get_unless_cancelled, chunks, cancelled)
+            if pcm_chunk is None:
+                break
+            if len(pcm_chunk) < frame_bytes:
+                # Merge chunks that are already queued into one frame; never wait for more audio.
+                frame = bytearray(pcm_chunk)
+                while len(frame) < frame_bytes:
+                    try:
+                        next_chunk = chunks.get_nowait()
+                    except queue.Empty:
+                        break
+                    if next_chunk is None:
+                        finished = True
+                        break
+                    frame += next_chunk
+                pcm_chunk = frame
+            await ws.send(pcm_chunk)
+    finally:
+        cancelled.set()
+        # Generation must finish before the caller releases the inference semaphore.
+        await producer
 
 
 async def websocket_handler(ws):
     path = getattr(ws, "path", "/")
     if path not in {"/tts", "/"}:
-        await ws.send(json.dumps({"status": "error", "message": f"Invalid path: {path}"}))
+        await ws.send(_json_dumps({"status": "error", "message": f"Invalid path: {path}"}))
         return
 
     await ws.send(
-        json.dumps(
+        _json_dumps(
             {
                 "status": "connected",
                 "message": "TTS Server Ready (CosyVoice LoRA)",
@@ -77,14 +250,19 @@ async def websocket_handler(ws):
 
     async for message in ws:
         try:
-            req = json.loads(message)
+            req = _json_loads(message)
         except Exception:
-            await ws.send(json.dumps({"status": "error", "message": "Invalid JSON"}))
+            await ws.send(_json_dumps({"status": "error", "message": "Invalid JSON"}))
             continue
 
         text = (req.get("text") or "").strip()
         if not text:
-            await ws.send(json.dumps({"status": "error", "message": "Missing 'text'"}))
+            await ws.send(_json_dumps({"status": "error", "message": "Missing 'text'"}))
+            continue
+
+        encoding = req.get("encoding", "pcm_s16le")
+        if encoding != "pcm_s16le":
+            await ws.send(_json_dumps({"status": "error", "message": f"Unsupported encoding: {encoding}"}))
             continue
 
         speaker = req.get("speaker") or (tts_engine.get_default_speaker() if tts_engine else None)  # type: ignore[union-attr]
@@ -94,15 +272,13 @@ async def websocket_handler(ws):
         speed = float(req.get("speed", os.getenv("TTS_SPEED", "1.0")))
 
         try:
-            engine = await _get_engine()
+            if stream:
+                engine = await _get_engine()
 
-            # Avoid overlapping GPU inference which can trigger CUDA OOM.
-            sem = _get_infer_semaphore()
-            async with sem:
-
-                if stream:
+                # Avoid overlapping GPU inference which can trigger CUDA OOM.
+                async with _get_infer_semaphore():
                     await ws.send(
-                        json.dumps(
+                        _json_dumps(
                             {
                                 "status": "start",
                                 "stream": True,
@@ -113,47 +289,39 @@ async def websocket_handler(ws):
                         )
                     )
 
-                    loop = asyncio.get_running_loop()
                     try:
-                        await asyncio.to_thread(
-                            _stream_send_pcm_from_thread,
-                            loop,
-                            ws,
-                            engine,
-                            text,
-                            speaker,
-                            speed,
-                        )
+                        await _stream_send_pcm(ws, engine, text, speaker, speed)
                     except Exception:
                         # Client disconnects or send errors can surface here.
                         pass
 
                     try:
-                        await ws.send(json.dumps({"status": "done"}))
+                        await ws.send(_json_dumps({"status": "done"}))
                     except Exception:
                         pass
 
-                else:
-                    pcm = await asyncio.to_thread(engine.synthesize_sft_pcm, text, speaker, speed)
-                    await ws.send(
-                        json.dumps(
-                            {
-                                "status": "complete",
-                                "format": "pcm_s16le",
-                                "channels": 1,
-                                "sample_rate": 24000,
-                                "size": len(pcm),
-                            }
-                        )
+            else:
+                # Batched with other clients' requests; the worker holds the inference semaphore.
+                pcm = await _synthesize_batched(text, speaker, speed)
+                await ws.send(
+                    _json_dumps(
+                        {
+                            "status": "complete",
+                            "format": "pcm_s16le",
+                            "channels": 1,
+                            "sample_rate": 24000,
+                            "size": len(pcm),
+                        }
                     )
-                    try:
-                        await ws.send(pcm)
-                        await ws.send(json.dumps({"status": "done"}))
-                    except Exception:
-                        pass
+                )
+                try:
+                    await ws.send(pcm)
+                    await ws.send(_json_dumps({"status": "done"}))
+                except Exception:
+                    pass
 
         except Exception as exc:
-            await ws.send(json.dumps({"status": "error", "message": str(exc)}))
+            await ws.send(_json_dumps({"status": "error", "message": str(exc)}))
 
 
 async def main():
@@ -173,9 +341,12 @@ async def main():
             speaker = os.getenv("SPEAKER_ID") or engine.get_default_speaker() or "default"
             text = os.getenv("TTS_WARMUP_TEXT", "こんにちは")
             speed = float(os.getenv("TTS_WARMUP_SPEED", "1.0"))
+            # Compiled engines need a second pass: the first traces, the second captures CUDA graphs.
+            runs = 2 if engine.compiled else 1
             sem = _get_infer_semaphore()
             async with sem:
-                await asyncio.to_thread(engine.synthesize_sft_pcm, text, speaker, speed)
+                for _ in range(runs):
+                    await asyncio.to_thread(engine.synthesize_sft_pcm, text, speaker, speed)
             print(f"[{_ts()}] [TTS] warmup done in {time.time() - start:.2f}s", flush=True)
         except Exception as exc:
             print(f"[{_ts()}] [TTS] warmup failed: {exc}", flush=True)
@@ -187,10 +358,26 @@ async def main():
         port,
         ping_interval=None,
         max_size=None,
+        # audio is raw PCM in binary frames; deflate would only burn CPU
+        compression=None,
     ):
+        batch_task = asyncio.create_task(_batch_worker())
         asyncio.create_task(_warmup_after_start())
-        await asyncio.Future()
+        try:
+            await asyncio.Future()
+        finally:
+            batch_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await batch_task
+
+
+def _run(coro) -> None:
+    # uvloop must own the loop from the start, so pick it before asyncio.run
+    if uvloop is not None:
+        uvloop.run(coro)
+    else:
+        asyncio.run(coro)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    _run(main())
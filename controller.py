@@ -1,20 +1,35 @@
 import asyncio
+import contextlib
 import os
+import queue
 import re
 import sys
 import json
-import base64
-import tempfile
+import shutil
+import socket
 import subprocess
-import time        # 動画再生待機用
+import threading
 import websockets  # 「耳」(STT)・「口」(TTS) 接続用
+from websockets.protocol import State
 import httpx       # 「頭」(LLM) 接続用
 import pyaudio     # 「口」(TTS) の音声を再生用
 import wave
 import io
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
+try:
+    import orjson  # 高速JSON（任意）
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop  # libuvベースのイベントループ（任意）
+except ImportError:
+    uvloop = None
+
 # --- Google Cloud認証設定 ---
 # Application Default Credentials (ADC) を使用する場合は、
 # 以下のコメントを解除してプロジェクトIDを設定
@@ -36,11 +51,28 @@ PROMPT_TEXT = os.getenv("PROMPT_TEXT", "")  # プロンプトテキスト（LoRA
 
 # --- 音声再生の設定 ---
 AUDIO_FORMAT = pyaudio.paInt16
+SAMPLE_WIDTH = pyaudio.get_sample_size(AUDIO_FORMAT)  # paInt16 なので 2 バイト
 CHANNELS = 1
 RATE = 24000  # CosyVoiceは 24kHz
 CHUNK_SIZE = 1024  # 再生バッファサイズ
 OUTPUT_DIR = Path(__file__).resolve().parent
 
+# TTSをストリーミングで受信し、届いたチャンクから順に再生する（TTS_STREAM=1 で有効化）
+# 既定は一括受信（以前ストリーミングで無限ループが起きたため、サーバー側を確認してから有効にする）
+TTS_STREAM = os.getenv("TTS_STREAM", "false").lower() in ("1", "true", "yes")
+# 再生開始直後のアンダーランを防ぐための無音プライミング（ミリ秒）
+PLAYBACK_PRIME_MS = int(os.getenv("PLAYBACK_PRIME_MS", "200"))
+# PortAudioのコールバックで再生する（blocking write を使わない。デフォルト無効）
+PLAYBACK_CALLBACK = os.getenv("PLAYBACK_CALLBACK", "false").lower() in ("1", "true", "yes")
+# これより小さいチャンクは、キューに溜まっている分とまとめてから書き込む（バイト）
+PLAYBACK_COALESCE_BYTES = int(os.getenv("PLAYBACK_COALESCE_BYTES", str(CHUNK_SIZE * 2)))
+# コールバックモードで先読みしておく音声の上限（バイト、既定0.5秒分）
+PLAYBACK_CALLBACK_MAX_BYTES = RATE * CHANNELS * SAMPLE_WIDTH // 2
+
+# 短い定型文（あいさつ・相づち等）の合成結果をメモリにキャッシュして再利用する
+TTS_CACHE_MAX = int(os.getenv("TTS_CACHE_MAX", "128"))
+TTS_CACHE_MAX_CHARS = int(os.getenv("TTS_CACHE_MAX_CHARS", "20"))
+
 # 環境変数で出力ファイル保存を制御（デフォルト: 保存しない）
 SAVE_MOUTH_OUTPUT = os.getenv("SAVE_MOUTH_OUTPUT", "false").lower() in ("1", "true", "yes")
 
@@ -49,61 +81,326 @@ SAVE_MOUTH_OUTPUT = os.getenv("SAVE_MOUTH_OUTPUT", "false").lower() in ("1", "tr
 ENABLE_FACE_ANIMATION = os.getenv("ENABLE_FACE_ANIMATION", "false").lower() in ("1", "true", "yes")
 FACE_IMAGE_PATH = Path(__file__).parent / "face_wav2lip" / "narisawa_face.jpg"
 
+# 動画再生に使うコマンド（起動時に1度だけ探す）
+FFPLAY_BIN = shutil.which("ffplay")
+FFPROBE_BIN = shutil.which("ffprobe")
+
+# コールバックモードの再生バッファ（再生スレッドが追記し、PortAudioのスレッドが先頭から取り出す）
+_callback_buffer = bytearray()
+_callback_cond = threading.Condition()
+
+
+def _output_callback(in_data, frame_count, time_info, status):
+    n = frame_count * CHANNELS * SAMPLE_WIDTH
+    with _callback_cond:
+        data = bytes(_callback_buffer[:n])
+        del _callback_buffer[:n]
+        _callback_cond.notify_all()
+    if len(data) < n:
+        # 音声が届いていない間は無音で埋める
+        data += b"\x00" * (n - len(data))
+    return data, pyaudio.paContinue
+
+
 # グローバルな再生ストリーム
 try:
     p = pyaudio.PyAudio()
     audio_stream = p.open(format=AUDIO_FORMAT,
                           channels=CHANNELS,
                           rate=RATE,
-                          output=True)
+                          output=True,
+                          frames_per_buffer=CHUNK_SIZE,
+                          start=True,
+                          stream_callback=_output_callback if PLAYBACK_CALLBACK else None)
+    # 出力バッファを無音で満たしておく（最初のチャンク到着前のアンダーラン対策）
+    if PLAYBACK_PRIME_MS > 0 and not PLAYBACK_CALLBACK:
+        audio_stream.write(b"\x00" * (RATE * PLAYBACK_PRIME_MS // 1000 * CHANNELS * SAMPLE_WIDTH))
 except Exception as e:
     print(f"🛑 [Audio] PyAudioの初期化に失敗しました: {e}")
     print("    マイクやスピーカーが正しく接続されているか確認してください。")
     exit()
 
 processing_lock: asyncio.Lock | None = None
-SENTENCE_SPLIT_REGEX = re.compile(r"(.+?[。？！!?]+)")
+# TTSサーバーへの同時リクエスト数（ターン全体は processing_lock、TTSはこちらで保護）
+_tts_semaphore: asyncio.Semaphore | None = None
 
 
-def save_audio_result(audio_bytes: bytes) -> Path | None:
-    if not audio_bytes:
-        return None
+def _json_loads(data: str | bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj) -> str:
+    # テキストフレームとして送るため str で返す
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+# 各サーバーへの接続はターンをまたいで使い回す（run_controller で生成・終了時にクローズ）
+LLM_CLIENT: httpx.AsyncClient | None = None
+FACE_CLIENT: httpx.AsyncClient | None = None
+_tts_ws = None
+_tts_ws_lock: asyncio.Lock | None = None
+# 再生スレッドに渡すPCM（None: 終了 / threading.Event: ここまで再生済みの合図）
+_playback_queue: queue.Queue = queue.Queue()
+_playback_thread: threading.Thread | None = None
+# (話者ID, テキスト) -> PCM。古いものから捨てるLRU
+_TTS_CACHE: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+# 直近に投入した顔アニメーション（生成→再生）タスク。再生順を保つために連結する
+_face_playback_tail: asyncio.Task | None = None
+# 出力WAVの書き込み用（1スレッドなので open → writeframes → close の順序が保たれる）
+_save_executor: ThreadPoolExecutor | None = None
+SENTENCE_END_REGEX = re.compile(r"[。？！!?]+")
+
+
+def open_audio_result() -> tuple[wave.Wave_write, Path] | None:
+    """
+    受信しながら書き込むための出力WAVを開く（チャンクごとに writeframes する）
+    """
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
     output_path = OUTPUT_DIR / f"mouth_output_{timestamp}.wav"
     try:
-        with wave.open(str(output_path), "wb") as wf:
-            wf.setnchannels(CHANNELS)
-            wf.setsampwidth(p.get_sample_size(AUDIO_FORMAT))
-            wf.setframerate(RATE)
-            wf.writeframes(audio_bytes)
+        wf = wave.open(str(output_path), "wb")
+        wf.setnchannels(CHANNELS)
+        wf.setsampwidth(SAMPLE_WIDTH)
+        wf.setframerate(RATE)
     except Exception as exc:
         print(f"⚠️ [Mouth] 音声の保存に失敗しました: {exc}")
         return None
+    return wf, output_path
+
+
+def close_audio_result(result: tuple[wave.Wave_write, Path], total_bytes: int) -> Path | None:
+    wf, output_path = result
+    try:
+        wf.close()
+    except Exception as exc:
+        print(f"⚠️ [Mouth] 音声の保存に失敗しました: {exc}")
+        return None
+    if total_bytes == 0:
+        # 音声が届かなかった場合は空ファイルを残さない
+        output_path.unlink(missing_ok=True)
+        return None
     return output_path
 
-def _split_sentences(buffer: str) -> tuple[list[str], str]:
+class SentenceSplitter:
     """
-    ストリーミング中に溜めたテキストから文末（。？！!?のいずれか）の文を取り出し、
-    残りのバッファを返す。
+    ストリーミングで届くテキストから文末（。？！!?のいずれか）までの文を取り出す。
+    届いた断片だけを走査し、文末が来るまでは断片のリストに溜めておく（文字列の連結は文ごとに1回）。
+    断片の末尾ちょうどで終わった文は、続く記号（「！」の後の「？」など）が次の断片に来ることがあるため、
+    次の断片が記号以外で始まるか flush() されるまで保留する。
     """
-    sentences: list[str] = []
-    remainder_start = 0
-    for match in SENTENCE_SPLIT_REGEX.finditer(buffer):
-        sentence = match.group(1).strip()
+
+    def __init__(self):
+        self._parts: list[str] = []  # 文末記号がまだ来ていない断片
+        self._ended = False  # _parts が文末記号で終わっている（保留中の文）
+
+    def _take(self, sentences: list[str]) -> None:
+        sentence = "".join(self._parts).strip()
+        self._parts.clear()
+        self._ended = False
         if sentence:
             sentences.append(sentence)
-        remainder_start = match.end()
 
-    remainder = buffer[remainder_start:]
-    return sentences, remainder
+    def feed(self, text: str) -> list[str]:
+        sentences: list[str] = []
+        if self._ended and text and not SENTENCE_END_REGEX.match(text):
+            self._take(sentences)
+        pos = 0
+        for match in SENTENCE_END_REGEX.finditer(text):
+            self._parts.append(text[pos:match.end()])
+            pos = match.end()
+            if pos == len(text):
+                self._ended = True
+            else:
+                self._take(sentences)
+        if pos < len(text):
+            self._parts.append(text[pos:])
+        return sentences
+
+    def flush(self) -> str:
+        """保留中の文、または文末記号で終わらなかった残りを返してリセットする"""
+        remainder = "".join(self._parts).strip()
+        self._parts.clear()
+        self._ended = False
+        return remainder
+
+
+def _playback_worker():
+    """
+    再生キューのPCMをPyAudioに書き込むスレッド（Noneで終了）。
+    threading.Event が来たら、それまでに積まれた音声を書き終えた合図として set する。
+    """
+    pending = bytearray()
+    held = None  # 結合中に取り出した制御アイテム（Event / None）
+    while True:
+        item = held if held is not None else _playback_queue.get()
+        held = None
+        if item is None:
+            break
+        if isinstance(item, threading.Event):
+            if PLAYBACK_CALLBACK:
+                # コールバックが取り出し切るまで待つ
+                with _callback_cond:
+                    _callback_cond.wait_for(lambda: not _callback_buffer)
+            item.set()
+            continue
+
+        # 既にキューに溜まっている小さなチャンクは1回の書き込みにまとめる（待ちはしない）
+        data = item
+        if len(item) < PLAYBACK_COALESCE_BYTES:
+            pending += item
+            while len(pending) < PLAYBACK_COALESCE_BYTES:
+                try:
+                    nxt = _playback_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None or isinstance(nxt, threading.Event):
+                    held = nxt
+                    break
+                pending += nxt
+            data = bytes(pending)
+            pending.clear()
+
+        try:
+            if PLAYBACK_CALLBACK:
+                with _callback_cond:
+                    # 先読みしすぎないよう、バッファに空きができるまで待つ
+                    _callback_cond.wait_for(lambda: len(_callback_buffer) < PLAYBACK_CALLBACK_MAX_BYTES)
+                    _callback_buffer.extend(data)
+            else:
+                audio_stream.write(data)
+        except Exception as e:
+            print(f"⚠️ [Mouth] チャンク再生エラー: {e}")
 
 
-async def _generate_face_animation(audio_path: Path) -> Path | None:
+async def _wait_playback():
+    """再生キューに積んだ音声を全て書き終えるまで待つ（イベントループは止めない）"""
+    drained = threading.Event()
+    _playback_queue.put(drained)
+    await asyncio.get_running_loop().run_in_executor(None, drained.wait)
+
+
+# 小さな制御メッセージ（PAUSE/RESUME、ストリーミングのテキスト断片）をNagleで遅らせない
+TCP_NODELAY_OPTIONS = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+
+
+def _set_tcp_nodelay(ws):
+    sock = ws.transport.get_extra_info("socket")
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
+
+
+def _get_tts_semaphore() -> asyncio.Semaphore:
+    global _tts_semaphore
+    if _tts_semaphore is None:
+        _tts_semaphore = asyncio.Semaphore(1)
+    return _tts_semaphore
+
+
+def _get_tts_ws_lock() -> asyncio.Lock:
+    global _tts_ws_lock
+    if _tts_ws_lock is None:
+        _tts_ws_lock = asyncio.Lock()
+    return _tts_ws_lock
+
+
+def _get_save_executor() -> ThreadPoolExecutor:
+    global _save_executor
+    if _save_executor is None:
+        _save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wav-save")
+    return _save_executor
+
+
+async def _get_tts_ws():
+    """
+    TTSサーバーとのWebSocketを返す（未接続・切断済みなら接続し直す）
+    接続確認メッセージ（connected）は接続時に1度だけ受信する
     """
-    音声ファイルから顔アニメーション動画を生成
+    global _tts_ws
+    if _tts_ws is not None and _tts_ws.state is State.OPEN:
+        return _tts_ws
+
+    await _close_tts_ws()
+    # 使い回す接続なので、pingで相手の死活を検知する（合成に時間がかかっても切れないよう timeout は長め）
+    # 音声はバイナリPCMで流れてくるので permessage-deflate は無効（圧縮が効かずCPUだけ食う）
+    ws = await websockets.connect(
+        MOUTH_TTS_SERVER_URL,
+        ping_interval=20,
+        ping_timeout=60,
+        max_size=None,
+        compression=None,
+    )
+    _set_tcp_nodelay(ws)
+    # 接続確認メッセージを受信（最初のメッセージ）
+    connect_msg = await ws.recv()
+    connect_response = _json_loads(connect_msg)
+    if connect_response.get("status") == "connected":
+        print(f"✅ [Mouth] TTS接続確認: {connect_response.get('message')}")
+    _tts_ws = ws
+    return ws
+
+
+async def _send_tts_request(request: dict):
+    """
+    TTSリクエストを送信し、(接続, 最初のレスポンス) を返す。
+    使い回した接続がサーバー側で閉じられていた場合は、1度だけ張り直して送り直す
+    （まだ何も受信していないので再送しても安全）
+    """
+    reused = _tts_ws is not None
+    ws = await _get_tts_ws()
+    try:
+        return ws, await _exchange_first_response(ws, request)
+    except websockets.exceptions.ConnectionClosed:
+        if not reused:
+            raise
+        print(f"🔄 [Mouth] TTS接続が切れていたため再接続します")
+        await _close_tts_ws()
+        ws = await _get_tts_ws()
+        return ws, await _exchange_first_response(ws, request)
+
+
+async def _exchange_first_response(ws, request: dict) -> dict:
+    await ws.send(_json_dumps(request))
+    # 最初のレスポンスを受信（接続確認が遅れて届いた場合は読み飛ばす）
+    first_response = _json_loads(await ws.recv())
+    if first_response.get("status") == "connected":
+        first_response = _json_loads(await ws.recv())
+    return first_response
+
+
+async def _close_tts_ws():
+    global _tts_ws
+    ws, _tts_ws = _tts_ws, None
+    if ws is not None:
+        try:
+            await ws.close()
+        except Exception:
+            pass
+
+
+def _build_wav_bytes(pcm: bytes | bytearray) -> bytes:
+    """PCM (16bit mono) にWAVヘッダを付けてメモリ上で返す"""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(CHANNELS)
+        wf.setsampwidth(SAMPLE_WIDTH)
+        wf.setframerate(RATE)
+        wf.writeframes(pcm)
+    return buf.getvalue()
+
+
+async def _generate_face_animation(audio_wav_bytes: bytes) -> Path | None:
+    """
+    音声（WAVバイト列）から顔アニメーション動画を生成
     
     Args:
-        audio_path: 音声ファイルのパス
+        audio_wav_bytes: WAVヘッダ付きの音声データ
         
     Returns:
         生成された動画ファイルのパス（失敗時はNone）
@@ -118,36 +415,31 @@ async def _generate_face_animation(audio_path: Path) -> Path | None:
     print(f"\n🎭 [Face] リップシンク動画生成中...", flush=True)
     
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            # 音声ファイルを読み込み
-            with open(audio_path, "rb") as f:
-                audio_data = f.read()
+        # multipart/form-dataでリクエスト
+        files = {
+            "audio": ("audio.wav", audio_wav_bytes, "audio/wav")
+        }
+        data = {
+            "face_image": str(FACE_IMAGE_PATH)
+        }
+        
+        response = await FACE_CLIENT.post(FACE_SERVER_URL, files=files, data=data)
+        
+        if response.status_code == 200:
+            # 動画ファイルを保存
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            output_path = OUTPUT_DIR / f"face_output_{timestamp}.mp4"
             
-            # multipart/form-dataでリクエスト
-            files = {
-                "audio": ("audio.wav", audio_data, "audio/wav")
-            }
-            data = {
-                "face_image": str(FACE_IMAGE_PATH)
-            }
+            with open(output_path, "wb") as f:
+                f.write(response.content)
             
-            response = await client.post(FACE_SERVER_URL, files=files, data=data)
+            print(f"✅ [Face] 動画生成完了: {output_path.name} ({len(response.content)/1024:.1f}KB)")
+            return output_path
+        else:
+            print(f"🛑 [Face] 動画生成エラー (Status: {response.status_code})")
+            print(f"     詳細: {response.text[:200]}")
+            return None
             
-            if response.status_code == 200:
-                # 動画ファイルを保存
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-                output_path = OUTPUT_DIR / f"face_output_{timestamp}.mp4"
-                
-                with open(output_path, "wb") as f:
-                    f.write(response.content)
-                
-                print(f"✅ [Face] 動画生成完了: {output_path.name} ({len(response.content)/1024:.1f}KB)")
-                return output_path
-            else:
-                print(f"🛑 [Face] 動画生成エラー (Status: {response.status_code})")
-                print(f"     詳細: {response.text[:200]}")
-                return None
-                
     except httpx.ConnectError:
         print(f"🛑 [Face] Faceサーバーに接続できません ({FACE_SERVER_URL})")
         print(f"💡 確認: Faceサーバーが起動しているか")
@@ -162,7 +454,7 @@ async def _generate_face_animation(audio_path: Path) -> Path | None:
         return None
 
 
-def _play_video(video_path: Path):
+async def _play_video(video_path: Path):
     """
     生成された動画を再生
     ffplayまたはmacOSのデフォルトビューアーで開く
@@ -173,34 +465,41 @@ def _play_video(video_path: Path):
     try:
         print(f"🎬 [Face] 動画再生中: {video_path.name}")
         
-        # ffplayがあれば使用（ブロッキング再生）
-        result = subprocess.run(["which", "ffplay"], 
-                               stdout=subprocess.PIPE, 
-                               stderr=subprocess.PIPE)
-        
-        if result.returncode == 0:
-            # ffplayで再生（再生完了まで待機）
-            subprocess.run(["ffplay", "-autoexit", "-hide_banner", 
-                          "-loglevel", "error", str(video_path)])
+        # ffplayがあれば使用（再生完了まで待機。イベントループは止めない）
+        if FFPLAY_BIN:
+            # 入力解析・バッファリングを最小にして起動を速くする
+            proc = await asyncio.create_subprocess_exec(
+                FFPLAY_BIN, "-autoexit", "-hide_banner",
+                "-loglevel", "error",
+                "-fflags", "nobuffer", "-flags", "low_delay",
+                "-probesize", "32", "-analyzeduration", "0",
+                str(video_path),
+            )
+            await proc.wait()
         else:
             # macOSのデフォルトプレーヤーで再生（非ブロッキング）
             print(f"💡 [Face] ffplayが見つかりません。デフォルトプレーヤーで開きます")
-            subprocess.Popen(["open", str(video_path)], 
-                            stdout=subprocess.DEVNULL, 
-                            stderr=subprocess.DEVNULL)
+            await asyncio.create_subprocess_exec(
+                "open", str(video_path),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
             # ffprobeで動画の長さを取得
             try:
-                result = subprocess.run([
-                    "ffprobe", "-v", "error", "-show_entries", 
+                proc = await asyncio.create_subprocess_exec(
+                    FFPROBE_BIN or "ffprobe", "-v", "error", "-show_entries",
                     "format=duration", "-of", "default=noprint_wrappers=1:nokey=1",
-                    str(video_path)
-                ], capture_output=True, text=True)
-                duration = float(result.stdout.strip()) if result.returncode == 0 else 3.0
+                    str(video_path),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+                stdout, _ = await proc.communicate()
+                duration = float(stdout.decode().strip()) if proc.returncode == 0 else 3.0
             except:
                 duration = 3.0  # デフォルト
             
             print(f"⏳ [Face] 動画再生待機: {duration:.1f}秒")
-            time.sleep(duration + 1)  # 余裕を持たせる
+            await asyncio.sleep(duration + 1)  # 余裕を持たせる
             
     except Exception as e:
         print(f"⚠️ [Face] 動画再生エラー: {e}")
@@ -211,152 +510,154 @@ async def _infer_and_play_tts(full_text: str):
     Linux上のCosyVoice TTSサーバーにWebSocket経由でテキストを送信し、
     音声を受信・再生する
     """
+    global _face_playback_tail
     if not full_text:
         return
 
+    # キャッシュ済みの短い定型文はサーバーに問い合わせずに再生
+    cache_key = (SPEAKER_ID, full_text)
+    cached_audio = _TTS_CACHE.get(cache_key)
+    if cached_audio is not None:
+        _TTS_CACHE.move_to_end(cache_key)
+        print(f"\n♻️  [Mouth] キャッシュから再生: '{full_text}'", flush=True)
+        if ENABLE_FACE_ANIMATION:
+            _face_playback_tail = asyncio.create_task(
+                _face_generate_and_play(_build_wav_bytes(cached_audio), _face_playback_tail)
+            )
+            return
+        _playback_queue.put(cached_audio)
+    else:
+        # TTSサーバー（LoRA適用のCosyVoiceはGPU 1ストリーム）へのアクセスはここで絞る
+        async with _get_tts_semaphore():
+            await _infer_and_play_tts_inner(full_text)
+
+
+async def _infer_and_play_tts_inner(full_text: str):
+    """
+    TTSサーバーとの1発話分のやり取り（呼び出し側で _tts_semaphore を取得済み）
+    """
+    global _face_playback_tail
+    cache_key = (SPEAKER_ID, full_text)
+
     print(f"\n👄 [Mouth] 音声合成中: '{full_text}'", flush=True)
 
     try:
-        # TTSは合成に時間がかかることがあるため、クライアント側pingで接続が切れないようにする
-        async with websockets.connect(
-            MOUTH_TTS_SERVER_URL,
-            ping_interval=None,
-            max_size=None,
-        ) as ws:
-            # 接続確認メッセージを受信（最初のメッセージ）
-            connect_msg = await ws.recv()
-            connect_response = json.loads(connect_msg)
-            if connect_response.get("status") == "connected":
-                print(f"✅ [Mouth] TTS接続確認: {connect_response.get('message')}")
-            
-            # リクエスト送信（LoRA話者IDは環境変数で切り替え）
-            request = {
-                "text": full_text,
-                "mode": "sft",  # LoRA使用時はsftモード
-                "speaker": SPEAKER_ID,
-                "stream": False  # ストリーミング無効化（無限ループ回避）
-            }
-            await ws.send(json.dumps(request))
-            
-            # 最初のレスポンスを受信
-            first_msg = await ws.recv()
-            first_response = json.loads(first_msg)
-            
-            audio_chunks: list[bytes] = []
-            played_realtime = False
+        # 1発話ずつ順番に使う（レスポンスの読み取りが混ざらないようにする）
+        async with _get_tts_ws_lock():
+            try:
+                # リクエスト送信（LoRA話者IDは環境変数で切り替え）
+                request = {
+                    "text": full_text,
+                    "mode": "sft",  # LoRA使用時はsftモード
+                    "speaker": SPEAKER_ID,
+                    "stream": TTS_STREAM,
+                    # ヘッダ無しPCM（24kHz/mono/int16）をそのまま再生キューに渡す
+                    "encoding": "pcm_s16le",
+                }
+                ws, first_response = await _send_tts_request(request)
             
-            # ストリーミングモード
-            if first_response.get("status") == "start" and first_response.get("stream"):
-                print(f"🎵 [Mouth] ストリーミング開始 (format: {first_response.get('format')}, rate: {first_response.get('sample_rate')}Hz)")
+                # 保持するのは「保存用WAV」と「顔アニメーション用の音声」だけ（どちらも必要な時のみ）
+                # ディスクI/Oは保存用スレッドで行い、受信・再生のループを止めない
+                loop = asyncio.get_running_loop()
+                audio_result = (
+                    await loop.run_in_executor(_get_save_executor(), open_audio_result)
+                    if SAVE_MOUTH_OUTPUT else None
+                )
+                face_audio = bytearray() if ENABLE_FACE_ANIMATION else None
+                cache_audio = bytearray() if TTS_CACHE_MAX > 0 and len(full_text) <= TTS_CACHE_MAX_CHARS else None
+                total_bytes = 0
+                chunk_count = 0
+                failed = False
+
+                def _consume_audio(chunk: bytes) -> None:
+                    nonlocal total_bytes, chunk_count
+                    total_bytes += len(chunk)
+                    chunk_count += 1
+                    if audio_result is not None:
+                        # 完了は待たない（close が同じスレッドで後から実行される）
+                        _get_save_executor().submit(audio_result[0].writeframes, chunk)
+                    if cache_audio is not None:
+                        cache_audio.extend(chunk)
+                    if face_audio is not None:
+                        # face有効時は動画側で音声を再生するのでここでは鳴らさない
+                        face_audio.extend(chunk)
+                        return
+                    # 再生スレッドに渡すだけ（PortAudioの書き込み待ちで受信を止めない）
+                    _playback_queue.put(chunk)
+
+                # ストリーミングモード
+                if first_response.get("status") == "start" and first_response.get("stream"):
+                    print(f"🎵 [Mouth] ストリーミング開始 (format: {first_response.get('format')}, rate: {first_response.get('sample_rate')}Hz)")
                 
-                # バイナリチャンクを連続受信
-                while True:
-                    msg = await ws.recv()
+                    # バイナリチャンクを連続受信
+                    while True:
+                        msg = await ws.recv()
                     
-                    # JSONメッセージ（done/error）をチェック
-                    if isinstance(msg, str):
-                        response = json.loads(msg)
-                        if response.get("status") == "done":
-                            print(f"✅ [Mouth] ストリーミング完了 ({len(audio_chunks)} chunks)")
-                            break
-                        elif response.get("status") == "error":
-                            print(f"🛑 [Mouth] TTSエラー: {response.get('message', '不明なエラー')}")
-                            return
+                        # JSONメッセージ（done/error）をチェック
+                        if isinstance(msg, str):
+                            response = _json_loads(msg)
+                            if response.get("status") == "done":
+                                print(f"✅ [Mouth] ストリーミング完了 ({chunk_count} chunks)")
+                                break
+                            elif response.get("status") == "error":
+                                print(f"🛑 [Mouth] TTSエラー: {response.get('message', '不明なエラー')}")
+                                failed = True
+                                break
                     
-                    # バイナリチャンク（音声データ）
-                    elif isinstance(msg, bytes):
-                        audio_chunks.append(msg)
-                        # リアルタイム再生
-                        try:
-                            audio_stream.write(msg)
-                            played_realtime = True
-                        except Exception as e:
-                            print(f"⚠️ [Mouth] チャンク再生エラー: {e}")
+                        # バイナリチャンク（音声データ）をリアルタイム再生
+                        elif isinstance(msg, bytes):
+                            _consume_audio(msg)
             
-            # 非ストリーミングモード
-            elif first_response.get("status") == "complete":
-                print(f"🎵 [Mouth] 一括音声受信 (format: {first_response.get('format')}, rate: {first_response.get('sample_rate')}Hz, size: {first_response.get('size')} bytes)")
+                # 非ストリーミングモード
+                elif first_response.get("status") == "complete":
+                    print(f"🎵 [Mouth] 一括音声受信 (format: {first_response.get('format')}, rate: {first_response.get('sample_rate')}Hz, size: {first_response.get('size')} bytes)")
                 
-                # 音声データ受信
-                audio_data = await ws.recv()
-                if isinstance(audio_data, bytes):
-                    audio_chunks.append(audio_data)
+                    # 音声データ受信（ヘッダ無しPCM）
+                    audio_data = await ws.recv()
+                    if isinstance(audio_data, bytes):
+                        _consume_audio(audio_data)
                 
-                # done メッセージ受信
-                done_msg = await ws.recv()
-                done_response = json.loads(done_msg)
-                if done_response.get("status") == "done":
-                    print(f"✅ [Mouth] 一括音声完了")
+                    # done メッセージ受信
+                    done_msg = await ws.recv()
+                    done_response = _json_loads(done_msg)
+                    if done_response.get("status") == "done":
+                        print(f"✅ [Mouth] 一括音声完了")
             
-            else:
-                print(f"🛑 [Mouth] 予期しないレスポンス: {first_response}")
-                return
-            
-            # 全チャンク結合
-            audio_bytes = b''.join(audio_chunks)
-            print(f"🔊 [Mouth] 総音声データ: {len(audio_bytes)} bytes ({len(audio_bytes)/48000:.2f}s)")
-
-            # 音声を保存（任意）
-            if SAVE_MOUTH_OUTPUT:
-                saved = save_audio_result(audio_bytes)
-                if saved:
-                    print(f"💾 [Mouth] 音声保存: {saved.name}")
-
-            # face無し: 音声をローカルで再生して終了
-            if not ENABLE_FACE_ANIMATION:
-                if played_realtime:
+                else:
+                    print(f"🛑 [Mouth] 予期しないレスポンス: {first_response}")
+                    failed = True
+
+                print(f"🔊 [Mouth] 総音声データ: {total_bytes} bytes ({total_bytes/48000:.2f}s)")
+
+                # 音声を保存（任意）
+                if audio_result is not None:
+                    saved = await loop.run_in_executor(
+                        _get_save_executor(), close_audio_result, audio_result, total_bytes
+                    )
+                    if saved:
+                        print(f"💾 [Mouth] 音声保存: {saved.name}")
+
+                if cache_audio and not failed:
+                    # 再生キューへ渡せるよう不変のbytesとして保持（受信バッファと共有しない）
+                    _TTS_CACHE[cache_key] = bytes(cache_audio)
+                    if len(_TTS_CACHE) > TTS_CACHE_MAX:
+                        _TTS_CACHE.popitem(last=False)
+
+                # face無し: 音声は受信しながら再生済み
+                if failed or not face_audio:
                     return
+                # WAVはメモリ上で組み立ててそのまま送る（一時ファイルを経由しない）
+                audio_wav_bytes = _build_wav_bytes(face_audio)
+
+                # 顔アニメーション生成はバックグラウンドで進め、次の文のTTS受信と重ねる
+                _face_playback_tail = asyncio.create_task(
+                    _face_generate_and_play(audio_wav_bytes, _face_playback_tail)
+                )
+            except BaseException:
+                # 途中で失敗した接続は未読のレスポンスが残っている可能性があるので捨てる
+                await _close_tts_ws()
+                raise
 
-                # WAVヘッダ付きかもしれないので両対応
-                try:
-                    if audio_bytes[:4] == b"RIFF" and b"WAVE" in audio_bytes[:16]:
-                        with wave.open(io.BytesIO(audio_bytes), "rb") as wf:
-                            frames = wf.readframes(wf.getnframes())
-                        audio_stream.write(frames)
-                    else:
-                        audio_stream.write(audio_bytes)
-                except Exception as exc:
-                    print(f"⚠️ [Mouth] 音声再生に失敗しました: {exc}")
-                return
-
-            # 音声を一時ファイルに保存
-            temp_audio_path = OUTPUT_DIR / f"temp_audio_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.wav"
-            try:
-                with wave.open(str(temp_audio_path), "wb") as wf:
-                    wf.setnchannels(CHANNELS)
-                    wf.setsampwidth(p.get_sample_size(AUDIO_FORMAT))
-                    wf.setframerate(RATE)
-                    wf.writeframes(audio_bytes)
-                print(f"💾 [Mouth] 一時音声ファイル保存: {temp_audio_path.name}")
-            except Exception as exc:
-                print(f"⚠️ [Mouth] 一時音声ファイル保存失敗: {exc}")
-                return
-            
-            # 顔アニメーション生成（リップシンク）
-            print(f"🎭 [Face] リップシンク動画生成中...")
-            video_path = await _generate_face_animation(temp_audio_path)
-            
-            if video_path and video_path.exists():
-                # 動画を再生（音声も含まれる）
-                print(f"▶️  [Face] 動画再生開始: {video_path.name}")
-                _play_video(video_path)
-                print(f"✅ [Face] 動画再生完了")
-                
-                # 一時ファイルを削除
-                try:
-                    temp_audio_path.unlink()
-                    video_path.unlink()
-                    print(f"🧹 [Face] 一時ファイル削除完了")
-                except Exception as e:
-                    print(f"⚠️ [Face] 一時ファイル削除失敗: {e}")
-            else:
-                print(f"🛑 [Face] 動画生成に失敗しました")
-                # 一時音声ファイルを削除
-                try:
-                    temp_audio_path.unlink()
-                except Exception as e:
-                    pass
-                        
     except (ConnectionRefusedError, OSError) as e:
         print(f"🛑 [Mouth] TTSサーバーに接続できません: {e}")
         print(f"💡 確認: Linux上でTTSサーバーが起動しているか ({MOUTH_TTS_SERVER_URL})")
@@ -368,57 +669,165 @@ async def _infer_and_play_tts(full_text: str):
         traceback.print_exc()
 
 
+async def _tts_worker(sentence_queue: asyncio.Queue):
+    """
+    キューに積まれた文を順番にTTSへ送る（再生順を保つため1タスクで処理）
+    """
+    while True:
+        sentence = await sentence_queue.get()
+        if sentence is None:
+            break
+        await _infer_and_play_tts(sentence)
+
+
+async def _face_generate_and_play(audio_wav_bytes: bytes, previous: asyncio.Task | None):
+    """
+    顔アニメーション動画を生成して再生する。
+    生成は直前の発話の動画生成・再生と並行して進め、再生だけは発話順に行う。
+    """
+    # 顔アニメーション生成（リップシンク）
+    print(f"🎭 [Face] リップシンク動画生成中...")
+    face_task = asyncio.create_task(_generate_face_animation(audio_wav_bytes))
+    if previous is not None:
+        await previous
+    video_path = await face_task
+
+    if video_path and video_path.exists():
+        # 動画を再生（音声も含まれる）
+        print(f"▶️  [Face] 動画再生開始: {video_path.name}")
+        await _play_video(video_path)
+        print(f"✅ [Face] 動画再生完了")
+
+        # 一時ファイルを削除
+        try:
+            video_path.unlink()
+            print(f"🧹 [Face] 一時ファイル削除完了")
+        except Exception as e:
+            print(f"⚠️ [Face] 一時ファイル削除失敗: {e}")
+    else:
+        print(f"🛑 [Face] 動画生成に失敗しました")
+
+
+async def _wait_face_playback():
+    """投入済みの顔アニメーション動画を全て再生し終えるまで待つ"""
+    global _face_playback_tail
+    tail, _face_playback_tail = _face_playback_tail, None
+    if tail is not None:
+        await tail
+
+
+async def _warmup_connections():
+    """
+    起動時にTTS/Faceサーバーへの接続を張っておき、最初の発話でハンドシェイクを待たないようにする
+    """
+    try:
+        async with _get_tts_ws_lock():
+            await _get_tts_ws()
+    except Exception as e:
+        print(f"⚠️ [Mouth] TTSサーバーへの事前接続に失敗しました: {e}")
+
+    if ENABLE_FACE_ANIMATION:
+        try:
+            # 応答内容は問わない（キープアライブ接続を確立するだけ）
+            await FACE_CLIENT.get(FACE_SERVER_URL)
+        except Exception as e:
+            print(f"⚠️ [Face] Faceサーバーへの事前接続に失敗しました: {e}")
+
+
 async def stream_to_tts(text_stream_generator):
     """
-    LLMから送られてくるテキストを一括でTTSに送信する
-    チャンクに分けずに完全な文章を一度に処理
+    LLMから送られてくるテキストを文単位に区切り、
+    文末が届いた時点でTTSに送信する（LLMの生成とTTSを並行させる）
     """
-    full_text = ""
+    sentence_queue: asyncio.Queue = asyncio.Queue()
+    worker = asyncio.create_task(_tts_worker(sentence_queue))
+    splitter = SentenceSplitter()
+    total_chars = 0
 
-    # テキストを全て収集
-    async for text_chunk in text_stream_generator:
-        if not text_chunk:
-            continue
-        full_text += text_chunk
+    print(f"💬 [Head] 回答: ", end="", flush=True)
+    try:
+        async for text_chunk in text_stream_generator:
+            if not text_chunk:
+                continue
+            print(text_chunk, end="", flush=True)
+            total_chars += len(text_chunk)
+            for sentence in splitter.feed(text_chunk):
+                sentence_queue.put_nowait(sentence)
+
+        # 改行を追加
+        print()
+        print(f"🧠 [Head] 回答生成完了: {total_chars}文字")
+
+        # 文末記号で終わらなかった残りも送信
+        remainder = splitter.flush()
+        if remainder:
+            sentence_queue.put_nowait(remainder)
+    finally:
+        # 積み終わった文を再生し切ってから戻る
+        sentence_queue.put_nowait(None)
+        await worker
+        # 次の文の合成は前の文の再生と重ねて進めたので、ここでターン分の再生終了を待つ
+        await _wait_playback()
+        await _wait_face_playback()
+
+def _is_stt_status(line: str) -> bool:
+    # 先頭6文字だけ見て判定
+    prefix = line.lstrip()[:6].upper()
+    return prefix.startswith("ACK:") or prefix == "STATE:"
+
+
+def _parse_stt_transcript(message: str) -> str:
+    # STTサーバーは続けて確定した結果を {"type": "multi", "items": [...]} にまとめて送ってくる
+    if message.startswith("{"):
+        try:
+            payload = _json_loads(message)
+        except ValueError:
+            return message
+        if isinstance(payload, dict) and payload.get("type") == "multi":
+            return "".join(str(item).strip() for item in payload.get("items", []))
+    return message
 
-    # 改行を追加
-    print()
 
-    # 一括で送信
-    if full_text.strip():
-        await _infer_and_play_tts(full_text.strip())
+def _print_stt_status(line: str):
+    if line[:4].upper() == "ACK:":
+        print(f"📨 [Ears] {line}")
+        return
+    state = line.split(":", 1)[1].strip()
+    if state == "LISTENING":
+        print(f"🎤 [Ears] リスニング中...")
+    elif state == "PAUSED":
+        print(f"⏸️  [Ears] リスニング一時停止")
+
 
 async def handle_llm_response(text: str):
     """
     頭（LLM）サーバーにテキストを送信し、
-    一括で回答を受け取り、TTSに流す
+    ストリーミングで回答を受け取りながら文ごとにTTSに流す
     """
     try:
-        async with httpx.AsyncClient(timeout=None) as client:
-            print(f"🧠 [Head] 思考中...: '{text}'")
-            
-            # 一括リクエスト
-            response = await client.post(HEAD_LLM_SERVER_URL, json={"text": text})
-            
+        print(f"🧠 [Head] 思考中...: '{text}'")
+        
+        # ストリーミングリクエスト
+        async with LLM_CLIENT.stream("POST", HEAD_LLM_SERVER_URL, json={"text": text, "stream": True}) as response:
             if response.status_code != 200:
                 print(f"🛑 [Head] LLMサーバーエラー (Status: {response.status_code})")
-                error_body = response.text
+                error_body = (await response.aread()).decode("utf-8", errors="replace")
                 if error_body:
                     print(f"     詳細: {error_body[:200]}")
                 return
 
-            # JSON応答を取得
-            result = response.json()
-            full_response = result.get("response", "")
-            
-            print(f"🧠 [Head] 回答生成完了: {len(full_response)}文字")
-            print(f"💬 [Head] 回答: {full_response}")
-            
-            # 完全な応答をTTSに送信（ジェネレーターに変換）
-            async def text_generator():
-                yield full_response
-            
-            await stream_to_tts(text_generator())
+            # ストリーミング非対応のサーバーはJSONで一括応答を返す
+            if response.headers.get("content-type", "").startswith("application/json"):
+                result = _json_loads(await response.aread())
+                full_response = result.get("response", "")
+
+                async def text_generator():
+                    yield full_response
+
+                await stream_to_tts(text_generator())
+                return
+
+            await stream_to_tts(response.aiter_text())
 
     except httpx.ConnectError:
         print(f"🛑 [Head] LLMサーバーに接続できません")
@@ -433,10 +842,27 @@ async def run_controller():
     メインのコントローラー
     耳（STT）サーバーに接続し、テキストを待機する
     """
-    global processing_lock
+    global processing_lock, LLM_CLIENT, FACE_CLIENT, _playback_thread
     if processing_lock is None:
         processing_lock = asyncio.Lock()
 
+    # PyAudioへの書き込みは専用スレッドで行う
+    _playback_thread = threading.Thread(target=_playback_worker, daemon=True)
+    _playback_thread.start()
+
+    # LLM/Faceへの接続はキープアライブで使い回す
+    LLM_CLIENT = httpx.AsyncClient(
+        timeout=None,
+        transport=httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_keepalive_connections=4),
+            socket_options=TCP_NODELAY_OPTIONS,
+        ),
+    )
+    FACE_CLIENT = httpx.AsyncClient(
+        timeout=120.0,
+        transport=httpx.AsyncHTTPTransport(socket_options=TCP_NODELAY_OPTIONS),
+    )
+
     print("=" * 60)
     print("🚀 President Clone コントローラーを起動します")
     print("=" * 60)
@@ -455,6 +881,8 @@ async def run_controller():
     print(f"  - 話しかけると自動的に認識・応答します")
     print("=" * 60)
     
+    warmup_task = asyncio.create_task(_warmup_connections())
+
     print(f"\n👂 [Ears] STTサーバーに接続中...")
     
     retry_count = 0
@@ -462,7 +890,8 @@ async def run_controller():
     
     while retry_count < max_retries:
         try:
-            async with websockets.connect(EARS_STT_SERVER_URL) as websocket:
+            async with websockets.connect(EARS_STT_SERVER_URL, compression=None) as websocket:
+                _set_tcp_nodelay(websocket)
                 print("✅ [Ears] 接続成功！音声を待機中...\n")
                 
                 # リスニング再開を指示
@@ -478,34 +907,32 @@ async def run_controller():
                     if not message:
                         continue
                     
-                    # ステータスメッセージの処理
-                    if message.upper().startswith("ACK:"):
-                        print(f"📨 [Ears] {message}")
-                        continue
-                    
-                    if message.upper().startswith("STATE:"):
-                        state = message.split(":", 1)[1].strip()
-                        if state == "LISTENING":
-                            print(f"🎤 [Ears] リスニング中...")
-                        elif state == "PAUSED":
-                            print(f"⏸️  [Ears] リスニング一時停止")
+                    # ステータスメッセージの処理（複数行まとめて届くことがある）
+                    status_lines = message.split("\n")
+                    if all(_is_stt_status(line) for line in status_lines):
+                        for line in status_lines:
+                            _print_stt_status(line.strip())
                         continue
                     
                     # 音声認識結果を受信
+                    message = _parse_stt_transcript(message)
+                    if not message:
+                        continue
                     print(f"\n{'=' * 60}")
                     print(f"👂 [Ears] 音声認識結果: '{message}'")
                     print(f"{'=' * 60}")
 
-                    # リスニングを一時停止（応答中は音声認識しない）
-                    try:
-                        await websocket.send("PAUSE_LISTENING")
-                    except Exception as e:
-                        print(f"⚠️  [Ears] リスニング停止コマンド送信失敗: {e}")
-                    
-                    # LLMに送信して応答を取得・再生
                     async with processing_lock:
+                        # LLMへの送信を先に始め、その間にリスニングを一時停止（応答中は音声認識しない）
+                        llm_task = asyncio.create_task(handle_llm_response(message))
                         try:
-                            await handle_llm_response(message)
+                            await websocket.send("PAUSE_LISTENING")
+                        except Exception as e:
+                            print(f"⚠️  [Ears] リスニング停止コマンド送信失敗: {e}")
+
+                        # LLMの応答を取得・再生
+                        try:
+                            await llm_task
                         except Exception as e:
                             print(f"🛑 [処理エラー] {e}")
                         finally:
@@ -552,6 +979,17 @@ async def run_controller():
     
     # 終了処理
     print("\n🧹 クリーンアップ中...")
+    # 事前接続がまだ接続を使っている可能性があるので、クライアントを閉じる前に止める
+    warmup_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await warmup_task
+    await _close_tts_ws()
+    await LLM_CLIENT.aclose()
+    await FACE_CLIENT.aclose()
+    _playback_queue.put(None)
+    _playback_thread.join(timeout=5)
+    if _save_executor is not None:
+        _save_executor.shutdown(wait=True)
     try:
         if audio_stream.is_active():
             audio_stream.stop_stream()
@@ -561,9 +999,16 @@ async def run_controller():
     except Exception as e:
         print(f"⚠️  オーディオストリーム終了エラー: {e}")
 
+def _run(coro):
+    # uvloopがあればそれでイベントループを作る（asyncio.run より前に選ぶ必要がある）
+    if uvloop is not None:
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
+
 # --- スクリプトの実行 ---
 if __name__ == "__main__":
     try:
-        asyncio.run(run_controller())
+        _run(run_controller())
     except KeyboardInterrupt:
         print("\n🛑 コントローラーを終了します。")
@@ -1,16 +1,36 @@
 import asyncio
+import json
+import logging
 import os
 import threading
 import queue
+import math
+import socket
 import time
-import audioop
 from pathlib import Path
+import numpy as np
 from google.cloud import speech
 from google.oauth2 import service_account
 import pyaudio
 import websockets
 from websockets.server import WebSocketServerProtocol
 
+try:
+    import orjson  # 高速JSON（任意）
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop  # libuvベースのイベントループ（任意）
+except ImportError:
+    uvloop = None
+
+# 発話ごと・送信ごとに出るログは logging 経由（LOG_LEVEL=WARNING などで抑制できる）
+logger = logging.getLogger(__name__)
+_log_level = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper())
+# 不明なレベル名のときは起動を止めずに INFO にする
+logger.setLevel(_log_level if isinstance(_log_level, int) else logging.INFO)
+
 # --- Google Cloud 認証情報の設定 ---
 # Application Default Credentials (ADC) を優先使用
 # gcloud auth application-default login で認証済みの場合は自動的に使用されます
@@ -35,12 +55,39 @@ else:
 
 # --- 音声設定 ---
 RATE = 16000  # Google Speech-to-Textの推奨サンプリングレート
-CHUNK = int(RATE / 10)  # 100ms
+# 1回に読み取ってGoogleへ送る長さ（ms）。大きいほど読み取り・送信の回数は減るが、認識結果は遅れやすい
+# （Google は 100〜400ms 程度のチャンクを想定）
+CHUNK_MS = int(os.getenv("STT_CHUNK_MS", "200"))
+CHUNK = int(RATE * CHUNK_MS / 1000)
 FORMAT = pyaudio.paInt16
 CHANNELS = 1
+# PyAudioのコールバックモードで録音する（PortAudio側のスレッドがバッファリングし、読み取りでブロックしない）
+# macOSの一部環境でコールバックが不安定だったため、デフォルトは従来のブロッキング読み取り（専用スレッドで実行）
+INPUT_CALLBACK = os.getenv("STT_INPUT_CALLBACK", "false").lower() in ("1", "true", "yes")
+# キューに溜める最大チャンク数（約5秒分。溢れたら古いものから捨てる）
+INPUT_QUEUE_MAX_CHUNKS = max(1, 5000 // CHUNK_MS)
+# 1秒ごとにマイク入力レベルを表示する
+LEVEL_METER = os.getenv("AUDIO_LEVEL_METER", "false").lower() in ("1", "true", "yes")
+
+# 続けて確定した認識結果をまとめて1フレームで送る待ち時間
+# （既定の0では待たず、その時点でキューに溜まっている分だけをまとめる）
+TRANSCRIPT_COALESCE_SEC = float(os.getenv("STT_COALESCE_MS", "0")) / 1000
+
+
+
+def _rms_int16(chunk: bytes) -> int:
+    """16bit PCMのRMS（audioop.rms と同じスケール）。int16のまま内積を取り、float化は最後だけ"""
+    samples = np.frombuffer(chunk, dtype=np.int16)
+    if samples.size == 0:
+        return 0
+    # int16同士の内積はオーバーフローするので int64 で累積する
+    sq = int(np.dot(samples, samples.astype(np.int64)))
+    return int(math.sqrt(sq / samples.size))
+
 
 # --- WebSocketクライアント管理 ---
-connected_clients: set[WebSocketServerProtocol] = set()
+# 接続・切断のたびに作り直すタプル（ブロードキャストはコピーせずそのまま走査できる）
+connected_clients: tuple[WebSocketServerProtocol, ...] = ()
 listening_event = threading.Event()
 listening_event.set()  # 初期状態はリスニング中
 
@@ -57,6 +104,78 @@ def _get_websocket_path(websocket: WebSocketServerProtocol) -> str:
     return "/"
 
 
+def _json_loads(data: str | bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj) -> str:
+    # テキストフレームとして送るため str で返す
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def _parse_commands(message: str) -> list[str]:
+    """
+    制御メッセージからコマンドを取り出す。
+    {"cmds": [...]} 形式のJSON、または改行区切りのプレーンテキストに対応。
+    """
+    text = message.strip()
+    if text.startswith("{"):
+        try:
+            cmds = _json_loads(text).get("cmds")
+        except (ValueError, AttributeError):
+            cmds = None
+        if isinstance(cmds, list):
+            return [str(cmd).strip().upper() for cmd in cmds]
+    return [line.strip().upper() for line in text.split("\n") if line.strip()]
+
+
+def _apply_command(command: str) -> str | None:
+    """コマンドを実行し、クライアントに返す STATE 行（変化が無ければ None）を返す。"""
+    if command in ("PAUSE_LISTENING", "PAUSE"):
+        if listening_event.is_set():
+            logger.info("⏸️  [WS] Listening paused by controller.")
+            listening_event.clear()
+            return "STATE: PAUSED"
+
+    elif command in ("RESUME_LISTENING", "RESUME"):
+        if not listening_event.is_set():
+            logger.info("▶️  [WS] Listening resumed by controller.")
+            listening_event.set()
+            return "STATE: LISTENING"
+
+    elif command == "STATE_QUERY":
+        return "STATE: LISTENING" if listening_event.is_set() else "STATE: PAUSED"
+
+    else:
+        logger.info("ℹ️  [WS] 未対応のメッセージを受信: %s", command)
+    return None
+
+
+def _set_tcp_nodelay(websocket: WebSocketServerProtocol):
+    # 認識結果や STATE 行は小さいフレームなので Nagle で遅らせない
+    sock = websocket.transport.get_extra_info("socket")
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
+
+
+def _add_client(websocket: WebSocketServerProtocol):
+    global connected_clients
+    if websocket not in connected_clients:
+        connected_clients = (*connected_clients, websocket)
+
+
+def _remove_client(websocket: WebSocketServerProtocol):
+    global connected_clients
+    connected_clients = tuple(ws for ws in connected_clients if ws is not websocket)
+
+
 async def websocket_handler(websocket: WebSocketServerProtocol):
     """
     /listen に接続したクライアント（コントローラー等）を登録し、
@@ -66,39 +185,28 @@ async def websocket_handler(websocket: WebSocketServerProtocol):
     if path != "/listen":
         print(f"⚠️  [WS] /listen 以外のパスから接続されました: {path} @ {websocket.remote_address}")
     
-    connected_clients.add(websocket)
+    _set_tcp_nodelay(websocket)
+    _add_client(websocket)
     print(f"🔌 [WS] 接続: {websocket.remote_address}")
     
     try:
-        # 接続確認メッセージ
-        await websocket.send("ACK: Connected to STT Server")
-        await websocket.send("STATE: LISTENING")
+        # 接続確認メッセージ（ACK と現在の STATE を1フレームで送る）
+        state = "LISTENING" if listening_event.is_set() else "PAUSED"
+        await websocket.send(f"ACK: Connected to STT Server\nSTATE: {state}")
         
         async for message in websocket:
             if not isinstance(message, str):
                 continue
-            
-            command = message.strip().upper()
-            
-            if command == "PAUSE_LISTENING":
-                if listening_event.is_set():
-                    print("⏸️  [WS] Listening paused by controller.")
-                    listening_event.clear()
-                    await websocket.send("STATE: PAUSED")
-            
-            elif command == "RESUME_LISTENING":
-                if not listening_event.is_set():
-                    print("▶️  [WS] Listening resumed by controller.")
-                    listening_event.set()
-                    await websocket.send("STATE: LISTENING")
-            
-            else:
-                print(f"ℹ️  [WS] 未対応のメッセージを受信: {message}")
+
+            # 1フレームに複数コマンドが入っていても、返答は改行区切りの1フレームにまとめる
+            replies = [reply for reply in map(_apply_command, _parse_commands(message)) if reply]
+            if replies:
+                await websocket.send("\n".join(replies))
     
     except websockets.exceptions.ConnectionClosed:
         print(f"🔌 [WS] 接続が切断されました: {websocket.remote_address}")
     finally:
-        connected_clients.discard(websocket)
+        _remove_client(websocket)
         print(f"🔌 [WS] 切断完了: {websocket.remote_address}")
 
 
@@ -109,17 +217,17 @@ async def broadcast_text(text: str):
     if not connected_clients:
         return
 
-    disconnected = []
-    for ws in list(connected_clients):
-        try:
-            await ws.send(text)
-            print(f"📤 [WS] 送信: '{text}' → {ws.remote_address}")
-        except Exception as exc:
-            print(f"⚠️  [WS] 送信失敗: {exc}")
-            disconnected.append(ws)
+    # 遅いクライアントが他を待たせないよう、全クライアントへ並行して送る
+    clients = connected_clients
+    results = await asyncio.gather(
+        *(ws.send(text) for ws in clients), return_exceptions=True
+    )
 
-    for ws in disconnected:
-        connected_clients.discard(ws)
+    # 送信成功のログは出さない（認識結果は「認識完了」で表示済み）
+    for ws, result in zip(clients, results):
+        if isinstance(result, Exception):
+            logger.warning("⚠️  [WS] 送信失敗: %s", result)
+            _remove_client(ws)
 
 
 class SpeechToTextEngine:
@@ -162,7 +270,11 @@ class SpeechToTextEngine:
         # PyAudioの初期化
         self.audio = pyaudio.PyAudio()
         self.stream = None
-        self.audio_queue = queue.Queue()
+        # マイクの音声はいったんこのキューに積み、Googleへのリクエストはキューから取り出して作る
+        self.audio_queue = queue.Queue(maxsize=INPUT_QUEUE_MAX_CHUNKS)
+        # コールバックを使わない場合にブロッキング読み取りを担当するスレッド
+        self._pump_thread: threading.Thread | None = None
+        self._pump_stop = threading.Event()
 
         # 入力デバイス選択（任意）
         # - PYAUDIO_LIST_DEVICES=1 で一覧表示
@@ -233,15 +345,24 @@ class SpeechToTextEngine:
                 rate=RATE,
                 input=True,
                 frames_per_buffer=CHUNK,
-                # macOS対応: コールバックを使わない
-                stream_callback=None,
+                # macOS対応: デフォルトではコールバックを使わない（STT_INPUT_CALLBACK=1 で有効化）
+                stream_callback=self._input_callback if INPUT_CALLBACK else None,
                 input_device_index=self.input_device_index,
             )
             self.stream.start_stream()
+            if not INPUT_CALLBACK:
+                # 読み取り待ちでgRPCへの送信を止めないよう、読み取りは専用スレッドで行う
+                self._pump_stop.clear()
+                self._pump_thread = threading.Thread(target=self._pump_audio, daemon=True)
+                self._pump_thread.start()
             print("🎤 マイク入力を開始しました")
     
     def stop_audio_stream(self):
         """マイク入力ストリームを停止"""
+        if self._pump_thread is not None:
+            self._pump_stop.set()
+            self._pump_thread.join(timeout=2)
+            self._pump_thread = None
         if self.stream is not None:
             if self.stream.is_active():
                 self.stream.stop_stream()
@@ -249,34 +370,83 @@ class SpeechToTextEngine:
             self.stream = None
             print("🎤 マイク入力を停止しました")
     
-    def audio_generator(self):
-        """音声データをストリーミングで生成（ブロッキング読み取り）"""
-        level_meter = os.getenv("AUDIO_LEVEL_METER", "false").lower() in ("1", "true", "yes")
-        last_print = 0.0
-        while True:
-            # リスニングが一時停止したら、このストリーミングセッションを終了する。
-            # （無音のまま継続すると Google 側で Audio Timeout になりやすい）
-            if not listening_event.is_set():
-                break
-            
+    def _enqueue_chunk(self, chunk: bytes):
+        """チャンクをキューに積む（読み手が詰まっている間は最新の音声を優先し、書き手は決して待たせない）"""
+        try:
+            self.audio_queue.put_nowait(chunk)
+        except queue.Full:
             try:
-                # ブロッキングで音声データを読み取り
-                chunk = self.stream.read(CHUNK, exception_on_overflow=False)
+                self.audio_queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.audio_queue.put_nowait(chunk)
+            except queue.Full:
+                pass
 
-                if level_meter:
-                    now = time.monotonic()
-                    if now - last_print >= 1.0:
-                        try:
-                            rms = audioop.rms(chunk, 2)  # 16-bit = 2 bytes
-                            print(f"🔊 [MIC] rms={rms}")
-                        except Exception:
-                            pass
-                        last_print = now
-
-                yield chunk
+    def _input_callback(self, in_data, frame_count, time_info, status):
+        """PortAudioのスレッドから呼ばれる。チャンクをキューに積むだけで即座に戻る"""
+        # 一時停止中の音声（TTS再生中など）は次のセッションに持ち越さない
+        if listening_event.is_set():
+            self._enqueue_chunk(in_data)
+        return (None, pyaudio.paContinue)
+
+    def _pump_audio(self):
+        """ブロッキング読み取りでマイクの音声をキューに積み続ける（コールバックを使わない場合）"""
+        while not self._pump_stop.is_set():
+            # 一時停止中は読み取らない（RESUMEで起こされるまで待つ）
+            if not listening_event.wait(timeout=0.5):
+                continue
+            try:
+                chunk = self.stream.read(CHUNK, exception_on_overflow=False)
             except Exception as e:
+                if self._pump_stop.is_set():
+                    break
                 print(f"⚠️  音声読み取りエラー: {e}")
-                break
+                self._pump_stop.wait(timeout=0.5)
+                continue
+            if listening_event.is_set():
+                self._enqueue_chunk(chunk)
+
+    def _drain_audio_queue(self):
+        while True:
+            try:
+                self.audio_queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def audio_generator(self):
+        """音声データをストリーミングで生成（レベルメーターの有無はここで1度だけ選ぶ）"""
+        chunks = self._queued_chunks()
+        return self._metered(chunks) if LEVEL_METER else chunks
+
+    def _queued_chunks(self):
+        """コールバック／読み取りスレッドが積んだチャンクを返す"""
+        # 前のセッションの残りを捨ててから始める
+        self._drain_audio_queue()
+        # リスニングが一時停止したら、このストリーミングセッションを終了する。
+        # （無音のまま継続すると Google 側で Audio Timeout になりやすい）
+        while listening_event.is_set():
+            try:
+                chunk = self.audio_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            yield chunk
+
+    @staticmethod
+    def _metered(chunks):
+        """1秒ごとに入力レベルを表示しながらチャンクをそのまま流す"""
+        last_print = 0.0
+        for chunk in chunks:
+            now = time.monotonic()
+            if now - last_print >= 1.0:
+                try:
+                    rms = _rms_int16(chunk)
+                    print(f"🔊 [MIC] rms={rms}")
+                except Exception:
+                    pass
+                last_print = now
+            yield chunk
     
     def process_responses(self, responses):
         """Google Speech-to-Textからのレスポンスを処理"""
@@ -291,7 +461,7 @@ class SpeechToTextEngine:
             transcript = result.alternatives[0].transcript.strip()
             
             if result.is_final and transcript:
-                print(f"✅ [STT] 認識完了: {transcript}")
+                logger.info("✅ [STT] 認識完了: %s", transcript)
                 yield transcript
     
     def cleanup(self):
@@ -308,7 +478,40 @@ class SpeechToTextEngine:
             print(f"⚠️  PyAudio終了エラー: {e}")
 
 
-def transcription_worker(loop: asyncio.AbstractEventLoop, stop_event: threading.Event):
+async def dispatch_transcripts(transcripts: asyncio.Queue):
+    """
+    ワーカースレッドから届いた認識結果を順にブロードキャストする（None で終了）。
+    すでに溜まっている結果は {"type": "multi", "items": [...]} の1フレームにまとめる。
+    """
+    stopping = False
+    while not stopping:
+        text = await transcripts.get()
+        if text is None:
+            break
+        batch = [text]
+        try:
+            while True:
+                if TRANSCRIPT_COALESCE_SEC > 0:
+                    item = await asyncio.wait_for(transcripts.get(), TRANSCRIPT_COALESCE_SEC)
+                else:
+                    item = transcripts.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+        except (asyncio.QueueEmpty, asyncio.TimeoutError):
+            pass
+        if len(batch) == 1:
+            await broadcast_text(text)
+        else:
+            await broadcast_text(_json_dumps({"type": "multi", "items": batch}))
+
+
+def transcription_worker(
+    loop: asyncio.AbstractEventLoop,
+    transcripts: asyncio.Queue,
+    stop_event: threading.Event,
+):
     """
     音声認識を実行するワーカースレッド
     """
@@ -324,7 +527,7 @@ def transcription_worker(loop: asyncio.AbstractEventLoop, stop_event: threading.
     
     print("✅ 初期化完了")
     print("\n🎤 音声を待機中... (話しかけてください。Ctrl+Cで停止)")
-    if os.getenv("AUDIO_LEVEL_METER", "false").lower() not in ("1", "true", "yes"):
+    if not LEVEL_METER:
         print("💡 ヒント: 入力確認は `AUDIO_LEVEL_METER=1` を付けて起動すると分かりやすいです")
     
     try:
@@ -335,13 +538,14 @@ def transcription_worker(loop: asyncio.AbstractEventLoop, stop_event: threading.
             try:
                 # リスニングが一時停止中は、Googleのストリーミングセッション自体を開始しない
                 # （音声を送らずに待つと Audio Timeout になるため）
-                while not listening_event.is_set() and not stop_event.is_set():
-                    time.sleep(0.05)
+                # （sleepで見に行かず、RESUMEで起こされるまで待つ。停止確認のためタイムアウト付き）
+                while not listening_event.wait(timeout=0.5) and not stop_event.is_set():
+                    pass
 
                 if stop_event.is_set():
                     break
 
-                print("🎧 [STT] Google Streaming セッションを開始...")
+                logger.debug("🎧 [STT] Google Streaming セッションを開始...")
 
                 # 音声ストリームを生成
                 audio_generator = engine.audio_generator()
@@ -361,13 +565,10 @@ def transcription_worker(loop: asyncio.AbstractEventLoop, stop_event: threading.
                 transcript_count = 0
                 for transcript in engine.process_responses(responses):
                     transcript_count += 1
-                    # 認識結果をWebSocketクライアントに送信
-                    asyncio.run_coroutine_threadsafe(
-                        broadcast_text(transcript),
-                        loop,
-                    )
+                    # 認識結果をキューに積む（送信はイベントループ側の dispatch_transcripts が行う）
+                    loop.call_soon_threadsafe(transcripts.put_nowait, transcript)
 
-                print(f"🎧 [STT] ストリーミングセッション終了 (認識: {transcript_count}件)")
+                logger.debug("🎧 [STT] ストリーミングセッション終了 (認識: %d件)", transcript_count)
 
             except Exception as exc:
                 if not stop_event.is_set():
@@ -393,17 +594,22 @@ def transcription_worker(loop: asyncio.AbstractEventLoop, stop_event: threading.
 
 async def async_main():
     """メイン処理"""
+    global connected_clients
     loop = asyncio.get_running_loop()
     stop_event = threading.Event()
+    transcripts: asyncio.Queue = asyncio.Queue()
+    dispatcher = asyncio.create_task(dispatch_transcripts(transcripts))
 
     # WebSocketサーバーを起動
-    server = await websockets.serve(websocket_handler, host="0.0.0.0", port=8001)
+    server = await websockets.serve(
+        websocket_handler, host="0.0.0.0", port=8001, compression=None
+    )
     print("🔌 WebSocketサーバーを起動しました: ws://0.0.0.0:8001/listen")
 
     # 音声認識ワーカースレッドを起動
     worker = threading.Thread(
         target=transcription_worker,
-        args=(loop, stop_event),
+        args=(loop, transcripts, stop_event),
         daemon=True,
     )
     worker.start()
@@ -428,20 +634,32 @@ async def async_main():
             await asyncio.to_thread(worker.join, timeout=5)
         except Exception as e:
             print(f"⚠️  ワーカースレッド終了エラー: {e}")
+
+        # 積まれている認識結果を送り切ってから送信タスクを止める
+        transcripts.put_nowait(None)
+        await dispatcher
         
         # 接続中のクライアントをクローズ
-        for ws in list(connected_clients):
+        for ws in connected_clients:
             try:
                 await ws.close()
             except Exception:
                 pass
-        connected_clients.clear()
+        connected_clients = ()
         
         print("✅ サーバーを終了しました")
 
 
+def _run(coro):
+    # uvloopがあればそれでイベントループを作る（asyncio.run より前に選ぶ必要がある）
+    if uvloop is not None:
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
+
 if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s")
     try:
-        asyncio.run(async_main())
+        _run(async_main())
     except KeyboardInterrupt:
         print("\n🛑 終了します...")
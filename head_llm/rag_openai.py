@@ -2,12 +2,30 @@
 OpenAI Embeddings APIを使った高精度RAG
 文脈・意味・同義語を理解したベクトル検索
 """
+import hashlib
 import json
+import os
+import threading
+from collections import OrderedDict
 import numpy as np
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 from openai import OpenAI
 
+try:
+    import orjson  # 高速JSON（任意）
+except ImportError:
+    orjson = None
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+EMBEDDING_MODEL = "text-embedding-3-small"  # 安価で高精度
+# クエリ埋め込みのキャッシュ件数
+QUERY_CACHE_MAX = 512
+# 文書ベクトルを行ごとのスケール付きint8で保持する（メモリ1/4、スコアは近似値になる）
+EMB_INT8 = os.getenv("RAG_EMB_INT8", "false").lower() in ("1", "true", "yes")
+# int8モードで一度にfloat32へ戻す行数（クエリごとの一時メモリを 行数×次元×4バイト に抑える）
+INT8_SCORE_BLOCK_ROWS = 4096
+
 
 class OpenAIRAG:
     """OpenAI Embeddings APIを使ったベクトル検索RAG"""
@@ -16,10 +34,24 @@ class OpenAIRAG:
         self.knowledge_dir = Path(knowledge_dir)
         self.client = OpenAI()  # 環境変数 OPENAI_API_KEY を自動読み込み
         self.chunks: List[Dict] = []
-        self.embeddings: List[List[float]] = []
+        # 検索で使う列（本文と、本文以外の項目）をチャンクと同じ順で並べたもの
+        self.texts: List[str] = []
+        self.meta: List[Dict] = []
+        # 行ごとに正規化済みの埋め込み行列 (N, D)。内積がそのままコサイン類似度になる
+        self.emb_matrix: Optional[np.ndarray] = None
+        # RAG_EMB_INT8=1 のときは emb_matrix の代わりにこちらを使う
+        self.emb_int8: Optional[np.ndarray] = None
+        self.emb_scales: Optional[np.ndarray] = None
+        # クエリ文字列 -> 正規化済みベクトル。古いものから捨てるLRU
+        self._query_cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        # FastAPIのスレッドプールから同時に呼ばれるため、キャッシュの参照・更新はロック内で行う
+        self._query_cache_lock = threading.Lock()
         
         self._load_knowledge()
         self._build_embeddings()
+        if EMB_INT8 and self.emb_matrix is not None:
+            self.emb_int8, self.emb_scales = self._quantize_rows(self.emb_matrix)
+            self.emb_matrix = None
     
     def _load_knowledge(self):
         """JSONLファイルからナレッジを読み込み"""
@@ -34,42 +66,78 @@ class OpenAIRAG:
         
         for json_file in json_files:
             try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    # JSONL形式を想定（1行1JSON）
-                    for line in f:
-                        line = line.strip()
-                        if line:
-                            chunk = json.loads(line)
-                            self.chunks.append(chunk)
+                # JSONL形式を想定（1行1JSON）。ファイルはまとめて読み、空行だけ飛ばす
+                data = json_file.read_bytes()
+                self.chunks.extend(
+                    _json_loads(line) for line in data.split(b"\n") if line and not line.isspace()
+                )
             except Exception as e:
                 print(f"⚠️  {json_file.name}の読み込みエラー: {e}")
         
+        self.texts = [chunk.get('text', '') for chunk in self.chunks]
+        self.meta = [{key: value for key, value in chunk.items() if key != 'text'} for chunk in self.chunks]
         print(f"✅ ナレッジベース読み込み完了: {len(self.chunks)}件")
     
     def _build_embeddings(self):
-        """全チャンクをベクトル化（初回のみ）"""
+        """全チャンクをベクトル化（初回のみ。結果はナレッジディレクトリにキャッシュする）"""
         if not self.chunks:
             return
         
+        texts = self.texts
+        cache_path = self._embedding_cache_path(texts)
+        if self._load_embedding_cache(cache_path, len(texts)):
+            return
+        
         print(f"🔄 Embeddings API でベクトル化中... ({len(self.chunks)}件)")
         
         try:
             # 全チャンクを一括でベクトル化（効率的）
-            texts = [chunk['text'] for chunk in self.chunks]
-            
             response = self.client.embeddings.create(
-                model="text-embedding-3-small",  # 安価で高精度
+                model=EMBEDDING_MODEL,
                 input=texts
             )
             
-            self.embeddings = [item.embedding for item in response.data]
+            self.emb_matrix = self._normalize_rows([item.embedding for item in response.data])
             
-            print(f"✅ ベクトル化完了: {len(self.embeddings)}件")
-            print(f"📊 ベクトル次元: {len(self.embeddings[0])}次元")
+            print(f"✅ ベクトル化完了: {self.emb_matrix.shape[0]}件")
+            print(f"📊 ベクトル次元: {self.emb_matrix.shape[1]}次元")
+            self._save_embedding_cache(cache_path, self.emb_matrix)
             
         except Exception as e:
             print(f"❌ ベクトル化エラー: {e}")
-            self.embeddings = []
+            self.emb_matrix = None
+    
+    def _embedding_cache_path(self, texts: List[str]) -> Path:
+        """チャンク本文とモデル名から埋め込みキャッシュのパスを決める（本文が変われば別ファイル）"""
+        digest = hashlib.sha256("\0".join(texts).encode("utf-8")).hexdigest()[:16]
+        model = EMBEDDING_MODEL.replace("/", "_")
+        return self.knowledge_dir / f".emb_cache_{model}_{digest}.npy"
+    
+    def _load_embedding_cache(self, path: Path, count: int) -> bool:
+        """保存済みの埋め込みをmmapで読み込む（APIを呼ばずに済んだらTrue）"""
+        if not path.exists():
+            return False
+        try:
+            matrix = np.load(path, mmap_mode='r')
+        except Exception as e:
+            print(f"⚠️  ベクトルキャッシュの読み込みエラー: {e}")
+            return False
+        if matrix.ndim != 2 or matrix.shape[0] != count:
+            return False
+        self.emb_matrix = matrix
+        print(f"✅ ベクトルキャッシュを使用: {path.name} ({matrix.shape[0]}件, {matrix.shape[1]}次元)")
+        return True
+    
+    @staticmethod
+    def _save_embedding_cache(path: Path, matrix: np.ndarray):
+        """埋め込みを保存（書きかけのファイルを読まないよう一時ファイルから置き換える）"""
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, matrix)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️  ベクトルキャッシュの保存エラー: {e}")
     
     def search(self, query: str, top_k: int = 3) -> List[Dict]:
         """
@@ -87,52 +155,113 @@ class OpenAIRAG:
         Returns:
             関連するチャンクのリスト（スコアが高い順）
         """
-        if not self.chunks or not self.embeddings:
+        if not self.chunks or not self._has_embeddings():
+            return []
+        return self.search_many([query], top_k)[0]
+    
+    def search_many(self, queries: List[str], top_k: int = 3) -> List[List[Dict]]:
+        """
+        複数クエリをまとめて検索（埋め込みAPIは未キャッシュ分を1回だけ呼ぶ）
+        
+        Returns:
+            クエリごとの検索結果リスト（searchと同じ形式）
+        """
+        if not queries:
             return []
+        if not self.chunks or not self._has_embeddings():
+            return [[] for _ in queries]
         
         try:
-            # クエリをベクトル化
-            query_response = self.client.embeddings.create(
-                model="text-embedding-3-small",
-                input=query
-            )
-            query_embedding = query_response.data[0].embedding
-            
-            # コサイン類似度を計算
-            similarities = []
-            for chunk_embedding in self.embeddings:
-                similarity = self._cosine_similarity(query_embedding, chunk_embedding)
-                similarities.append(similarity)
-            
-            # スコアの高い順にソート
-            top_indices = np.argsort(similarities)[-top_k:][::-1]
-            
-            # 結果を返す
-            results = []
-            for idx in top_indices:
-                chunk = self.chunks[idx].copy()
-                chunk['score'] = float(similarities[idx])  # スコアを追加
-                results.append(chunk)
-            
-            return results
+            query_matrix = self._embed_queries(queries)
+            # (クエリ数, チャンク数) の類似度を行列積1回で計算
+            similarities = self._similarities(query_matrix)
+            return [self._rank(row, top_k) for row in similarities]
             
         except Exception as e:
             print(f"❌ 検索エラー: {e}")
-            return []
+            return [[] for _ in queries]
     
-    def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
-        """コサイン類似度を計算"""
-        vec1 = np.array(vec1)
-        vec2 = np.array(vec2)
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """クエリを正規化済みベクトル (クエリ数, D) に変換（同じクエリはキャッシュから返す）"""
+        keys = [query.strip() for query in queries]
+        cached = {}
+        with self._query_cache_lock:
+            for key in dict.fromkeys(keys):
+                vector = self._query_cache.get(key)
+                if vector is not None:
+                    self._query_cache.move_to_end(key)
+                    cached[key] = vector
         
-        dot_product = np.dot(vec1, vec2)
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
+        # 埋め込みAPIの呼び出し中はロックを持たない
+        missing = [key for key in dict.fromkeys(keys) if key not in cached]
+        fresh = dict(zip(missing, self._normalize_rows(self._embed_query_texts(missing)))) if missing else {}
         
-        if norm1 == 0 or norm2 == 0:
-            return 0.0
-        
-        return dot_product / (norm1 * norm2)
+        if fresh:
+            with self._query_cache_lock:
+                for key, vector in fresh.items():
+                    self._query_cache[key] = vector
+                    self._query_cache.move_to_end(key)
+                    while len(self._query_cache) > QUERY_CACHE_MAX:
+                        self._query_cache.popitem(last=False)
+        return np.stack([cached[key] if key in cached else fresh[key] for key in keys])
+    
+    def _embed_query_texts(self, texts: List[str]) -> List[List[float]]:
+        """クエリ用の埋め込みを1リクエストで取得"""
+        response = self.client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=texts
+        )
+        return [item.embedding for item in response.data]
+    
+    def _rank(self, similarities: np.ndarray, top_k: int) -> List[Dict]:
+        """類似度ベクトルから上位top_k件のチャンクを取り出す"""
+        # チャンクの辞書をコピーせず、本文・その他の項目・スコアから結果を1度で組み立てる
+        return [
+            {'text': self.texts[idx], **self.meta[idx], 'score': float(similarities[idx])}
+            for idx in self._top_k_indices(similarities, top_k)
+        ]
+    
+    def _has_embeddings(self) -> bool:
+        return self.emb_matrix is not None or self.emb_int8 is not None
+    
+    def _similarities(self, query_matrix: np.ndarray) -> np.ndarray:
+        """正規化済みクエリ (Q, D) と全チャンクのコサイン類似度 (Q, N)"""
+        if self.emb_int8 is None:
+            return query_matrix @ self.emb_matrix.T
+        # 全体をまとめて変換すると float32 と同じサイズの一時行列ができるため、
+        # 一定行数ずつ float32 に戻して BLAS で積和し、行ごとのスケールを掛け戻す
+        query_matrix = query_matrix.astype(np.float32, copy=False)
+        similarities = np.empty((query_matrix.shape[0], self.emb_int8.shape[0]), dtype=np.float32)
+        for start in range(0, self.emb_int8.shape[0], INT8_SCORE_BLOCK_ROWS):
+            stop = start + INT8_SCORE_BLOCK_ROWS
+            block = self.emb_int8[start:stop].astype(np.float32)
+            similarities[:, start:stop] = (query_matrix @ block.T) * self.emb_scales[start:stop]
+        return similarities
+    
+    @staticmethod
+    def _quantize_rows(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """各行を最大絶対値で int8 に量子化し、(int8行列, 行ごとのスケール) を返す"""
+        scales = np.abs(matrix).max(axis=-1) / 127.0
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        codes = np.round(matrix / scales[..., None]).astype(np.int8)
+        return codes, scales
+    
+    @staticmethod
+    def _normalize_rows(vectors) -> np.ndarray:
+        """float32の行列にして各行をL2正規化する"""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        matrix /= np.clip(norms, 1e-12, None)
+        return matrix
+
+    @staticmethod
+    def _top_k_indices(similarities: np.ndarray, top_k: int) -> np.ndarray:
+        """上位top_k件のインデックスをスコアが高い順に返す（全件ソートはしない）"""
+        k = min(top_k, len(similarities))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        part = np.argpartition(-similarities, k - 1)[:k]
+        return part[np.argsort(-similarities[part])]
     
     def format_context(self, chunks: List[Dict]) -> str:
         """検索結果を文字列に整形"""
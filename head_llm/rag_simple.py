@@ -3,14 +3,37 @@
 外部DBなし、JSONLファイルから知識を読み込んで検索
 """
 import json
+import os
 import re
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+
+try:
+    import hnswlib  # 近似最近傍探索（任意。RAG_HNSW=1 のときだけ使う）
+except ImportError:
+    hnswlib = None
+
+# HNSWは語彙数次元の密ベクトル（チャンク数×語彙数×4バイト）を持ち、結果もJaccardの厳密値とずれるため、
+# RAG_HNSW=1 のときだけ使う。既定は転置インデックスで全件を厳密にスコアする
+USE_HNSW = os.getenv("RAG_HNSW", "false").lower() in ("1", "true", "yes")
+# RAG_HNSW=1 でも、これ未満のチャンク数では転置インデックスを使う（小さいナレッジではこちらが速い）
+HNSW_MIN_CHUNKS = 2048
+# HNSWインデックスのパラメータ
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+# HNSWで top_k × この倍数の候補を取り、Jaccard類似度で並べ直す（cosineとJaccardの順位のずれを吸収）
+HNSW_CANDIDATE_FACTOR = 4
+# インデックス構築時に一度に密ベクトル化するチャンク数（メモリ使用量の上限）
+INDEX_BATCH = 1024
 
 
 class SimpleRAG:
     """JSON形式のナレッジベースを使ったシンプルなRAG"""
     
+    # ひらがな・カタカナ・漢字・英数字の連続をトークンとする
+    _TOKEN_RE = re.compile(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF\w]+')
+    
     def __init__(self, knowledge_dir: Path):
         """
         RAGシステムを初期化
@@ -20,7 +43,19 @@ class SimpleRAG:
         """
         self.knowledge_dir = Path(knowledge_dir)
         self.chunks: List[Dict] = []
+        # チャンクごとのトークン集合（読み込み時に1度だけ作る）
+        self._chunk_tokens: List[frozenset] = []
+        self._token_counts = np.zeros(0, dtype=np.int64)
+        # トークン -> 次元番号
+        self._vocab: Dict[str, int] = {}
+        # RAG_HNSW=1 の大きいナレッジ: HNSWインデックス（hnswlibがある場合のみ）
+        self._index = None
+        # それ以外: 転置インデックス（CSR形式）。トークン t を含むチャンク番号は
+        # _postings[_postings_ptr[t]:_postings_ptr[t + 1]]
+        self._postings: Optional[np.ndarray] = None
+        self._postings_ptr: Optional[np.ndarray] = None
         self._load_knowledge()
+        self._build_index()
     
     def _load_knowledge(self):
         """JSONLファイルからナレッジを読み込み"""
@@ -50,6 +85,85 @@ class SimpleRAG:
         
         print(f"✅ [RAG] ナレッジベース読み込み完了: {len(self.chunks)}件")
     
+    def _build_index(self):
+        """
+        チャンクのトークン集合から検索用の索引を作る
+        RAG_HNSW=1 かつチャンク数が HNSW_MIN_CHUNKS 以上で hnswlib があればHNSW、それ以外は転置インデックス
+        """
+        self._chunk_tokens = [frozenset(self._tokenize(chunk.get('text', ''))) for chunk in self.chunks]
+        self._token_counts = np.array([len(tokens) for tokens in self._chunk_tokens], dtype=np.int64)
+        for tokens in self._chunk_tokens:
+            for token in tokens:
+                self._vocab.setdefault(token, len(self._vocab))
+        
+        if USE_HNSW and hnswlib is not None and len(self.chunks) >= HNSW_MIN_CHUNKS:
+            self._build_hnsw()
+        else:
+            self._build_postings()
+    
+    def _build_hnsw(self):
+        """トークン集合を0/1ベクトルにしてHNSWインデックスを作る"""
+        # トークンが無いチャンクはどのクエリにも一致しないので索引に入れない
+        ids = [i for i, tokens in enumerate(self._chunk_tokens) if tokens]
+        if not ids:
+            return
+        
+        index = hnswlib.Index(space='cosine', dim=len(self._vocab))
+        index.init_index(max_elements=len(ids), M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION)
+        for start in range(0, len(ids), INDEX_BATCH):
+            batch = ids[start:start + INDEX_BATCH]
+            index.add_items(self._token_vectors([self._chunk_tokens[i] for i in batch]), np.asarray(batch))
+        self._index = index
+        print(f"✅ [RAG] HNSWインデックス構築完了: {len(ids)}件（語彙 {len(self._vocab)}）")
+    
+    def _build_postings(self):
+        """トークン -> それを含むチャンク番号 の転置インデックスを作る（CSR形式の配列2本）"""
+        token_ids = [
+            np.fromiter((self._vocab[token] for token in tokens), dtype=np.int64, count=len(tokens))
+            for tokens in self._chunk_tokens
+        ]
+        chunk_ids = np.repeat(np.arange(len(self.chunks), dtype=np.int64), self._token_counts)
+        token_ids = np.concatenate(token_ids) if token_ids else np.zeros(0, dtype=np.int64)
+        # トークン番号順（同じトークン内はチャンク番号順）に並べる
+        order = np.argsort(token_ids, kind='stable')
+        self._postings = chunk_ids[order]
+        self._postings_ptr = np.zeros(len(self._vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(token_ids, minlength=len(self._vocab)), out=self._postings_ptr[1:])
+    
+    def _postings_scores(self, query_tokens: set) -> np.ndarray:
+        """全チャンクとのJaccard類似度を、クエリトークンの転置リストだけから計算"""
+        lists = [
+            self._postings[self._postings_ptr[t]:self._postings_ptr[t + 1]]
+            for t in (self._vocab.get(token) for token in query_tokens) if t is not None
+        ]
+        intersection = (
+            np.bincount(np.concatenate(lists), minlength=len(self.chunks))
+            if lists else np.zeros(len(self.chunks), dtype=np.int64)
+        )
+        # 語彙に無いクエリトークンも和集合には数える
+        union = len(query_tokens) + self._token_counts - intersection
+        return intersection / np.maximum(union, 1)
+    
+    def _token_vectors(self, token_sets: List[frozenset]) -> np.ndarray:
+        """トークン集合を語彙次元の0/1ベクトル（行列）にする"""
+        vectors = np.zeros((len(token_sets), len(self._vocab)), dtype=np.float32)
+        for row, tokens in enumerate(token_sets):
+            cols = [self._vocab[token] for token in tokens if token in self._vocab]
+            vectors[row, cols] = 1.0
+        return vectors
+    
+    def _candidate_ids(self, query_tokens: set, top_k: int) -> List[int]:
+        """HNSWで候補チャンクを絞り込む"""
+        if self._index is None:
+            return []
+        if not any(token in self._vocab for token in query_tokens):
+            # 語彙に無いトークンだけのクエリはどのチャンクとも重ならない
+            return []
+        k = min(top_k * HNSW_CANDIDATE_FACTOR, self._index.get_current_count())
+        self._index.set_ef(max(k, 50))
+        labels, _ = self._index.knn_query(self._token_vectors([frozenset(query_tokens)]), k=k)
+        return labels[0].tolist()
+    
     def _tokenize(self, text: str) -> set:
         """
         テキストをトークン化（簡易版）
@@ -61,8 +175,7 @@ class SimpleRAG:
             トークンのセット
         """
         # ひらがな・カタカナ・漢字・英数字を抽出
-        tokens = re.findall(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF\w]+', text.lower())
-        return set(tokens)
+        return set(self._TOKEN_RE.findall(text.lower()))
     
     def search(self, query: str, top_k: int = 3, min_score: float = 0.0) -> List[Dict]:
         """
@@ -76,7 +189,7 @@ class SimpleRAG:
         Returns:
             関連するチャンクのリスト
         """
-        if not self.chunks:
+        if not self.chunks or top_k <= 0:
             return []
         
         # クエリをトークン化
@@ -85,34 +198,49 @@ class SimpleRAG:
         if not query_tokens:
             return []
         
-        # 各チャンクとのスコアを計算
-        scored_chunks: List[Tuple[float, Dict]] = []
+        if self._postings is not None:
+            top_results = self._top_postings(query_tokens, top_k, min_score)
+        else:
+            top_results = self._top_candidates(query_tokens, top_k, min_score)
         
-        for chunk in self.chunks:
-            text = chunk.get('text', '')
-            text_tokens = self._tokenize(text)
+        if top_results:
+            print(f"💡 [RAG] 検索ヒット: {len(top_results)}件（スコア: {top_results[0][0]:.3f}〜{top_results[-1][0]:.3f}）")
+        
+        return [chunk for score, chunk in top_results]
+    
+    def _top_postings(self, query_tokens: set, top_k: int, min_score: float) -> List[Tuple[float, Dict]]:
+        """転置インデックスで全件のスコアを計算し、上位top_k件だけを取り出す（全件ソートはしない）"""
+        scores = self._postings_scores(query_tokens)
+        # トークンの無いチャンクは除外
+        hits = np.nonzero((self._token_counts > 0) & (scores > min_score))[0]
+        if len(hits) > top_k:
+            # top_k番目のスコア以上をすべて残す（境界で同点のチャンクを任意に選ばないため）
+            cutoff = -np.partition(-scores[hits], top_k - 1)[top_k - 1]
+            hits = hits[scores[hits] >= cutoff]
+        # スコアの降順（同点はチャンク順）。以前の安定ソートと同じ結果になる
+        hits = hits[np.lexsort((hits, -scores[hits]))][:top_k]
+        return [(float(scores[i]), self.chunks[i]) for i in hits]
+    
+    def _top_candidates(self, query_tokens: set, top_k: int, min_score: float) -> List[Tuple[float, Dict]]:
+        """HNSWの候補をJaccard類似度で並べ直し、上位top_k件を返す"""
+        scored_chunks: List[Tuple[float, Dict]] = []
+        for i in self._candidate_ids(query_tokens, top_k):
+            text_tokens = self._chunk_tokens[i]
             
             if not text_tokens:
                 continue
             
-            # Jaccard類似度（集合の類似度）
-            intersection = query_tokens & text_tokens
-            union = query_tokens | text_tokens
-            score = len(intersection) / len(union) if union else 0
+            # Jaccard類似度（集合の類似度）。和集合は作らず要素数だけ求める
+            intersection = len(query_tokens & text_tokens)
+            union = len(query_tokens) + int(self._token_counts[i]) - intersection
+            score = intersection / union if union else 0
             
             if score > min_score:
-                scored_chunks.append((score, chunk))
+                scored_chunks.append((score, self.chunks[i]))
         
         # スコア順にソート（降順）
         scored_chunks.sort(reverse=True, key=lambda x: x[0])
-        
-        # Top-Kを返す
-        top_results = scored_chunks[:top_k]
-        
-        if top_results:
-            print(f"💡 [RAG] 検索ヒット: {len(top_results)}件（スコア: {top_results[0][0]:.3f}〜{top_results[-1][0]:.3f}）")
-        
-        return [chunk for score, chunk in top_results]
+        return scored_chunks[:top_k]
     
     def format_context(self, chunks: List[Dict]) -> str:
         """
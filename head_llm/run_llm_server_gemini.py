@@ -1,5 +1,7 @@
 import asyncio
 import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from typing import List
 
@@ -77,6 +79,30 @@ if RAG_ENABLED:
     else:
         print(f"⚠️  ナレッジディレクトリが見つかりません: {knowledge_dir}")
 
+# RAG検索結果のキャッシュ（正規化した質問, top_k）-> 結果。古いものから捨てるLRU
+RAG_CACHE_MAX = 512
+_rag_cache: OrderedDict[tuple[str, int], list] = OrderedDict()
+_rag_cache_lock = threading.Lock()
+
+
+def _cached_search(user_text: str, top_k: int = 3) -> list:
+    """同じ質問（前後の空白・大文字小文字の違いは無視）ではRAG検索を繰り返さない"""
+    key = (user_text.strip().lower(), top_k)
+    with _rag_cache_lock:
+        results = _rag_cache.get(key)
+        if results is not None:
+            _rag_cache.move_to_end(key)
+            return results
+    results = rag.search(user_text, top_k=top_k)
+    # 空の結果（検索エラー時を含む）はキャッシュしない
+    if results:
+        with _rag_cache_lock:
+            _rag_cache[key] = results
+            if len(_rag_cache) > RAG_CACHE_MAX:
+                _rag_cache.popitem(last=False)
+    return results
+
+
 # システムプロンプト
 SYSTEM_PROMPT = """あなたは成澤孝人のAIクローンです。
 成澤孝人の話し方、性格、知識を忠実に再現してください。
@@ -97,25 +123,20 @@ class ThinkRequest(BaseModel):
     text: str
     max_tokens: int = 500
     temperature: float = 0.7
+    stream: bool = False
 
 # --- 3. LLM推論 ---
-async def generate_complete_response(user_text: str, max_tokens: int, temperature: float):
-    """
-    Gemini APIで一括応答を生成（RAG対応）
-    ストリーミングではなく、完全な応答を一度に返す
-    """
-    try:
-        # RAG検索（有効な場合）
-        context = ""
-        if rag:
-            search_results = rag.search(user_text, top_k=3)
-            if search_results:
-                context = rag.format_context(search_results, max_length=1000)
-                print(f"📚 RAG検索: {len(search_results)}件ヒット")
-        
-        # プロンプト構築
-        if context:
-            full_prompt = f"""以下の参考情報を踏まえて、ユーザーの質問に答えてください。
+def _build_prompt(user_text: str) -> str:
+    """RAG検索結果（有効な場合）を踏まえたプロンプトを構築"""
+    context = ""
+    if rag:
+        search_results = _cached_search(user_text, top_k=3)
+        if search_results:
+            context = rag.format_context(search_results, max_length=1000)
+            print(f"📚 RAG検索: {len(search_results)}件ヒット")
+
+    if context:
+        return f"""以下の参考情報を踏まえて、ユーザーの質問に答えてください。
 
 【参考情報】
 {context}
@@ -123,18 +144,28 @@ async def generate_complete_response(user_text: str, max_tokens: int, temperatur
 【ユーザーの質問】
 {user_text}
 """
-        else:
-            full_prompt = user_text
-        
-        # Geminiモデル初期化
-        model = genai.GenerativeModel(
-            model_name=MODEL_NAME,
-            system_instruction=SYSTEM_PROMPT,
-            generation_config=genai.GenerationConfig(
-                max_output_tokens=max_tokens,
-                temperature=temperature,
-            )
+    return user_text
+
+
+def _build_model(max_tokens: int, temperature: float):
+    return genai.GenerativeModel(
+        model_name=MODEL_NAME,
+        system_instruction=SYSTEM_PROMPT,
+        generation_config=genai.GenerationConfig(
+            max_output_tokens=max_tokens,
+            temperature=temperature,
         )
+    )
+
+
+async def generate_complete_response(user_text: str, max_tokens: int, temperature: float):
+    """
+    Gemini APIで一括応答を生成（RAG対応）
+    ストリーミングではなく、完全な応答を一度に返す
+    """
+    try:
+        full_prompt = _build_prompt(user_text)
+        model = _build_model(max_tokens, temperature)
         
         # 一括生成（stream=False）
         response = model.generate_content(full_prompt, stream=False)
@@ -149,6 +180,28 @@ async def generate_complete_response(user_text: str, max_tokens: int, temperatur
         print(f"❌ [LLM] {error_message}")
         return error_message
 
+def generate_streaming_response(user_text: str, max_tokens: int, temperature: float):
+    """
+    Gemini APIで応答をストリーミング生成（RAG対応）
+    生成されたテキストを届いた順に返す（StreamingResponseがスレッドプールで回す）
+    """
+    try:
+        full_prompt = _build_prompt(user_text)
+        model = _build_model(max_tokens, temperature)
+
+        total = 0
+        for chunk in model.generate_content(full_prompt, stream=True):
+            text = chunk.text
+            if text:
+                total += len(text)
+                yield text
+        print(f"✅ [LLM] ストリーミング応答完了: {total}文字")
+
+    except Exception as e:
+        error_message = f"Error: {str(e)}"
+        print(f"❌ [LLM] {error_message}")
+        yield error_message
+
 # --- 4. エンドポイント ---
 
 @app.get("/")
@@ -167,9 +220,15 @@ async def health():
 @app.post("/think")
 async def think(request: ThinkRequest):
     """
-    LLM推論エンドポイント（一括応答）
+    LLM推論エンドポイント（stream=true ならプレーンテキストで逐次返す）
     """
     print(f"\n🧠 [LLM] ユーザー入力: {request.text}")
+
+    if request.stream:
+        return StreamingResponse(
+            generate_streaming_response(request.text, request.max_tokens, request.temperature),
+            media_type="text/plain; charset=utf-8",
+        )
     
     # 完全な応答を生成
     response_text = await generate_complete_response(
@@ -3,10 +3,13 @@ OpenAI版 LLMサーバー
 コントローラーからPOST /think でテキストを受け取り、応答を返す
 """
 import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
 
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from openai import OpenAI
 
@@ -66,11 +69,36 @@ if KNOWLEDGE_DIR.exists():
     except Exception as e:
         print(f"⚠️  RAG初期化エラー: {e}")
 
+# RAG検索結果のキャッシュ（正規化した質問, top_k）-> 結果。古いものから捨てるLRU
+RAG_CACHE_MAX = 512
+_rag_cache: OrderedDict[tuple[str, int], list] = OrderedDict()
+_rag_cache_lock = threading.Lock()
+
+
+def _cached_search(user_text: str, top_k: int = 3) -> list:
+    """同じ質問（前後の空白・大文字小文字の違いは無視）ではRAG検索を繰り返さない"""
+    key = (user_text.strip().lower(), top_k)
+    with _rag_cache_lock:
+        results = _rag_cache.get(key)
+        if results is not None:
+            _rag_cache.move_to_end(key)
+            return results
+    results = rag.search(user_text, top_k=top_k)
+    # 空の結果（検索エラー時を含む）はキャッシュしない
+    if results:
+        with _rag_cache_lock:
+            _rag_cache[key] = results
+            if len(_rag_cache) > RAG_CACHE_MAX:
+                _rag_cache.popitem(last=False)
+    return results
+
+
 app = FastAPI(title="Narisawa LLM Server (OpenAI)")
 
 
 class TextInput(BaseModel):
     text: str
+    stream: bool = False
 
 
 def _build_messages(user_text: str):
@@ -85,7 +113,7 @@ def _build_messages(user_text: str):
     
     # RAG検索
     if rag and rag.chunks:
-        results = rag.search(user_text, top_k=3)
+        results = _cached_search(user_text, top_k=3)
         print(f"📚 RAG検索: {len(results)}件ヒット")
         
         if results:
@@ -101,10 +129,36 @@ def _build_messages(user_text: str):
     return messages
 
 
+def _stream_response_text(user_text: str):
+    """生成されたテキストを届いた順に返す（StreamingResponseがスレッドプールで回す）"""
+    try:
+        messages = _build_messages(user_text)
+        stream = client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=messages,
+            stream=True,
+        )
+        total = 0
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                total += len(delta)
+                yield delta
+        print(f"✅ [LLM] ストリーミング応答完了: {total}文字")
+    except Exception as e:
+        print(f"❌ [LLM] Error: {e}")
+        yield f"エラーが発生しました: {e}"
+
+
 @app.post("/think")
 async def think(input_data: TextInput):
-    """テキストを受け取り、LLMの応答を返す"""
+    """テキストを受け取り、LLMの応答を返す（stream=true ならプレーンテキストで逐次返す）"""
     print(f"\n🧠 [LLM] ユーザー入力: {input_data.text}")
+
+    if input_data.stream:
+        return StreamingResponse(_stream_response_text(input_data.text), media_type="text/plain; charset=utf-8")
     
     try:
         messages = _build_messages(input_data.text)